@@ -0,0 +1,355 @@
+""" pytest-tracerobot: writes pytest sessions as Robot Framework output.
+
+The plugin is enabled with --tracerobot, or with tracerobot = true in the
+ini file. Otherwise only its options and the tracerobot marker are
+registered: the plugin itself, and with it Robot Framework, is not even
+imported, so that plain pytest runs do not pay for it.
+"""
+
+from .asserts import ASSERT_MODES
+from .capture import CAPTURE_MODES
+from .settings import MARKER_HELP, get_option
+from .tracer import AUTOTRACE_BACKENDS
+
+def pytest_addoption(parser):
+    group = parser.getgroup('tracerobot')
+    group.addoption(
+        '--tracerobot',
+        action='store_const',
+        const=True,
+        default=None,
+        help='Enable the plugin: write the session as Robot Framework output '
+             '(ini: tracerobot).'
+    )
+    group.addoption(
+        '--robot-output',
+        default='output.xml',
+        help='Path to Robot Framework XML output'
+    )
+    group.addoption(
+        '--robot-writer',
+        default='tracerobot',
+        choices=['tracerobot', 'stream'],
+        help='Output writer: "tracerobot" (default) or "stream", a '
+             'constant-memory writer that flushes each finished test to disk.'
+    )
+    group.addoption(
+        '--robot-journal',
+        default=None,
+        help='Write output events to this JSON lines journal during the run '
+             'and convert it to the output XML at the end. A journal left '
+             'behind by a killed run can be converted with '
+             'tracerobot-convert.'
+    )
+    group.addoption(
+        '--robot-split',
+        default=None,
+        metavar='DIR',
+        help='Write the output as separate parts into this directory, with '
+             'an index.json: a new part starts with each top-level suite '
+             '(see --robot-split-depth and --robot-split-size). Parts can '
+             'be combined with tracerobot-merge.'
+    )
+    group.addoption(
+        '--robot-split-depth',
+        type=int,
+        default=1,
+        help='With --robot-split, suites nested at most this deep start a '
+             'new part (default 1: the top-level suites).'
+    )
+    group.addoption(
+        '--robot-split-size',
+        type=float,
+        default=None,
+        help='With --robot-split, start a new part at the next test once '
+             'the current part exceeds this many MiB.'
+    )
+    group.addoption(
+        '--robot-rebot',
+        default=None,
+        choices=['background', 'wait'],
+        help='Generate the HTML log and report with rebot after the '
+             'session: "background" lets pytest exit while rebot runs, '
+             '"wait" waits for it. Parts of --robot-split are processed '
+             'in parallel.'
+    )
+    group.addoption(
+        '--robot-rebot-jobs',
+        type=int,
+        default=None,
+        help='With --robot-rebot, number of rebot processes run in '
+             'parallel (default: number of CPUs).'
+    )
+    group.addoption(
+        '--robot-history',
+        default=None,
+        help='SQLite database of test and fixture durations across runs. '
+             'Tests that are clearly slower or faster than in earlier runs '
+             'get the tag "regressed" or "improved".'
+    )
+    group.addoption(
+        '--robot-order',
+        default='collection',
+        choices=['collection', 'longest-first'],
+        help='With --robot-history, "longest-first" runs the tests that took '
+             'longest in earlier runs first.'
+    )
+    group.addoption(
+        '--robot-metrics',
+        default=False,
+        action='store_true',
+        help='Log wall time, CPU time, peak memory and garbage collections '
+             'of each test and of the outermost keywords.'
+    )
+    group.addoption(
+        '--robot-metrics-depth',
+        type=int,
+        default=1,
+        help='Keywords nested at most this deep get resource metrics '
+             '(default 1; 0 for tests only).'
+    )
+    group.addoption(
+        '--robot-slow-budget',
+        type=float,
+        default=None,
+        help='With --robot-metrics, tag tests that take longer than this '
+             'many seconds with "slow".'
+    )
+    group.addoption(
+        '--robot-memory-budget',
+        type=float,
+        default=None,
+        help='With --robot-metrics, tag tests whose peak memory grows by '
+             'more than this many MiB with "memory-heavy".'
+    )
+    group.addoption(
+        '--tracerobot-profile',
+        default=False,
+        action='store_true',
+        help='Measure the time spent in the hooks, tracer callbacks, logging '
+             'handler and output writer of the plugin. The profile is shown '
+             'in the terminal summary and written as metadata of the '
+             'top-level suite.'
+    )
+    group.addoption(
+        '--robot-fold-keywords',
+        default=False,
+        action='store_true',
+        help='Fold consecutive passing calls of the same keyword into one '
+             'keyword with call count and durations. Requires '
+             '--robot-writer=stream, --robot-journal or --robot-split.'
+    )
+    group.addoption(
+        '--trace-retain',
+        default='all',
+        choices=['all', 'failed'],
+        help='Which tests get their keywords and log messages written: '
+             '"all" (default) or only "failed" ones. "failed" requires '
+             '--robot-writer=stream, --robot-journal or --robot-split.'
+    )
+    group.addoption(
+        '--trace-retain-buffer',
+        default=100000,
+        type=int,
+        help='With --trace-retain=failed, maximum number of keyword and '
+             'message events kept per test; older events are dropped.'
+    )
+    group.addoption(
+        '--robot-asserts',
+        default=None,
+        choices=ASSERT_MODES,
+        help='How passed asserts are written: "each" (default) as a keyword '
+             'per assert, or "aggregate" as one keyword per assert location '
+             'and test phase, with the number of passes (ini: robot_asserts).'
+    )
+    group.addoption(
+        '--robot-log-level',
+        default=None,
+        help='Lowest level of Python log records written to the output '
+             '(default: DEBUG, ini: robot_log_level).'
+    )
+    group.addoption(
+        '--robot-log-filter',
+        dest='robot_log_filters',
+        action='append',
+        default=None,
+        metavar='LOGGER=LEVEL',
+        help='Log level for a logger and its children, e.g. urllib3=WARNING. '
+             'Can be given multiple times (ini: robot_log_filters).'
+    )
+    group.addoption(
+        '--robot-log-queue',
+        action='store_const',
+        const=True,
+        default=None,
+        help='Put log records, formatted, into a queue that a writer thread '
+             'writes to the output, instead of writing them from the '
+             'logging thread (ini: robot_log_queue).'
+    )
+    group.addoption(
+        '--robot-log-fold',
+        action='store_const',
+        const=True,
+        default=None,
+        help='Fold identical consecutive log records (same logger, level and '
+             'message template) into one message with a repeat count and '
+             'time span (ini: robot_log_fold).'
+    )
+    group.addoption(
+        '--robot-log-budget',
+        type=int,
+        default=None,
+        help='Write at most this many log records below WARNING per test; '
+             'the number of dropped records is logged at the end of the '
+             'test (ini: robot_log_budget).'
+    )
+    group.addoption(
+        '--robot-log-rate',
+        type=float,
+        default=None,
+        help='Write at most this many log records below WARNING per second '
+             'and logger (ini: robot_log_rate).'
+    )
+    parser.addini(
+        'tracerobot',
+        type='bool',
+        default=False,
+        help='Enable the plugin.'
+    )
+    parser.addini(
+        'robot_history',
+        default='',
+        help='SQLite database of test and fixture durations (see '
+             '--robot-history).'
+    )
+    parser.addini(
+        'robot_asserts',
+        default='each',
+        help='How passed asserts are written: "each" or "aggregate".'
+    )
+    parser.addini(
+        'robot_trace',
+        type='linelist',
+        default=[],
+        help='Per-test tracing settings as lines of a node id pattern and '
+             'options, e.g. "tests/load/* autotrace=false depth=2". '
+             'Options: autotrace, depth, libpaths (comma separated) and '
+             'log_level. The tracerobot marker takes precedence.'
+    )
+    parser.addini(
+        'robot_log_level',
+        default='DEBUG',
+        help='Lowest level of Python log records written to the output.'
+    )
+    parser.addini(
+        'robot_log_filters',
+        type='linelist',
+        default=[],
+        help='Per-logger log levels as LOGGER=LEVEL lines.'
+    )
+    parser.addini(
+        'robot_log_queue',
+        type='bool',
+        default=False,
+        help='Write log records through a queue (see --robot-log-queue).'
+    )
+    parser.addini(
+        'robot_log_fold',
+        type='bool',
+        default=False,
+        help='Fold identical consecutive log records (see --robot-log-fold).'
+    )
+    parser.addini(
+        'robot_log_budget',
+        default='',
+        help='Log records below WARNING written per test at most.'
+    )
+    parser.addini(
+        'robot_log_rate',
+        default='',
+        help='Log records below WARNING written per second and logger at '
+             'most.'
+    )
+    group.addoption(
+        '--no-autotrace',
+        dest='autotrace',
+        default=True,
+        action='store_false',
+        help='Disable automatic tracing of keywords. Suites, tests, '
+             'fixtures, asserts and log messages are still written.'
+    )
+    group.addoption(
+        '--autotrace-privates',
+        default=False,
+        action='store_const',
+        const=True,
+        help='If set, also auto trace private method.'
+    )
+    group.addoption(
+        '--autotrace-libpaths',
+        nargs="*",
+        help='List of paths for which the autotracer is enabled.'
+    )
+    group.addoption(
+        '--autotrace-backend',
+        default='settrace',
+        choices=AUTOTRACE_BACKENDS,
+        help='Autotracer implementation: "settrace" (default) or '
+             '"monitoring", which uses sys.monitoring on Python 3.12+ and '
+             'runs untraced code at full speed.'
+    )
+    group.addoption(
+        '--autotrace-args',
+        default='repr',
+        choices=CAPTURE_MODES,
+        help='How keyword arguments are captured: "repr" (default) renders '
+             'them when the keyword starts, "lazy" logs only their type and '
+             'size and renders them in full if the keyword fails.'
+    )
+    group.addoption(
+        '--autotrace-max-repr',
+        type=int,
+        default=1000,
+        help='Maximum length of a keyword argument representation.'
+    )
+    group.addoption(
+        '--autotrace-max-items',
+        type=int,
+        default=100,
+        help='Maximum number of collection items shown in a keyword argument.'
+    )
+    group.addoption(
+        '--autotrace-max-depth',
+        type=int,
+        default=6,
+        help='Maximum nesting depth shown in a keyword argument.'
+    )
+    group.addoption(
+        '--autotrace-subprocesses',
+        action='store_true',
+        default=False,
+        help='Trace also the Python processes started during a test, and '
+             'write them into the test. Requires --robot-writer=stream, '
+             '--robot-journal or --robot-split.'
+    )
+    group.addoption(
+        '--autotrace-threads',
+        action='store_true',
+        default=False,
+        help='Trace also the threads started during a test. Each thread is '
+             'written in keywords of its own, named after the thread. '
+             'Requires --robot-writer=stream, --robot-journal or '
+             '--robot-split.'
+    )
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", MARKER_HELP)
+    if not get_option(config, "tracerobot"):
+        return
+    from .plugin import (TraceRobotPlugin, TraceRobotXdistController,
+                         is_xdist_controller)
+    if is_xdist_controller(config):
+        plugin = TraceRobotXdistController(config)
+    else:
+        plugin = TraceRobotPlugin(config)
+    config.pluginmanager.register(plugin)
@@ -0,0 +1,98 @@
+""" Recording of passed asserts.
+
+Each passed assert is written as a keyword named after its location, with
+the assert statement as argument and pytest's explanation as message.
+
+In "aggregate" mode, the passes of the asserts at the same location are
+counted instead, and each location is written as one keyword when the
+current test phase (setup, call or teardown) ends. The keyword spans the
+time from the first to the last pass, and carries the number of passes and
+the explanation of the first pass. Failed asserts are not aggregated: their
+details are in the error message of the test.
+"""
+
+import os
+import time
+
+ASSERT_MODES = ["each", "aggregate"]
+
+
+class _Passes:
+    """ Passes of the assert at one location. """
+
+    __slots__ = ("name", "orig", "expl", "count", "first", "last")
+
+    def __init__(self, name, orig, expl):
+        self.name = name
+        self.orig = orig
+        self.expl = expl
+        self.count = 1
+        self.first = self.last = time.time()
+
+
+class AssertRecorder:
+    """ Writes passed asserts to output as keywords. """
+
+    def __init__(self, output, mode="each"):
+        self._output = output
+        self._aggregate = mode == "aggregate"
+        # keyword name by (path, lineno)
+        self._names = {}
+        # _Passes by (path, lineno), in the order of the first pass
+        self._passes = {}
+        # Asserts of the output writers themselves are rewritten by pytest
+        # too, if the plugin is installed; they must not be recorded.
+        self._writing = False
+
+    def keyword_name(self, path, lineno):
+        key = (path, lineno)
+        name = self._names.get(key)
+        if name is None:
+            name = self._names[key] = "%s:%d: assert" % (
+                os.path.basename(path), lineno)
+        return name
+
+    def passed(self, path, lineno, orig, expl):
+        if self._writing:
+            return
+        if not self._aggregate:
+            self._writing = True
+            try:
+                self._output.start_keyword(self.keyword_name(path, lineno),
+                                           args=[orig])
+                self._output.log_message(expl)
+                self._output.end_keyword()
+            finally:
+                self._writing = False
+            return
+
+        passes = self._passes.get((path, lineno))
+        if passes is None:
+            self._passes[(path, lineno)] = _Passes(
+                self.keyword_name(path, lineno), orig, expl)
+        else:
+            passes.count += 1
+            passes.last = time.time()
+
+    def flush(self):
+        """ Write the aggregated passes since the previous flush. """
+        if not self._passes:
+            return
+        passes, self._passes = self._passes, {}
+        self._writing = True
+        try:
+            self._write(passes.values())
+        finally:
+            self._writing = False
+
+    def _write(self, passes):
+        for assert_passes in passes:
+            self._output.start_keyword(assert_passes.name, args=[
+                assert_passes.orig], timestamp=assert_passes.first)
+            self._output.log_message(assert_passes.expl,
+                                     timestamp=assert_passes.first)
+            if assert_passes.count > 1:
+                self._output.log_message(
+                    "Passed %d times" % assert_passes.count,
+                    timestamp=assert_passes.last)
+            self._output.end_keyword(timestamp=assert_passes.last)
@@ -0,0 +1,105 @@
+""" Bounded rendering of keyword arguments.
+
+CapturePolicy limits the length, the number of collection items and the
+nesting depth of argument representations. Binary data and array-likes
+(objects with shape and dtype, e.g. numpy arrays) are summarized without
+calling their repr at all.
+
+In lazy mode, only a cheap summary (type and size) of each argument is
+rendered when a keyword starts, and references to the arguments are kept
+until the keyword ends. The full representation is rendered only if the
+keyword fails.
+"""
+
+import reprlib
+
+CAPTURE_MODES = ["repr", "lazy"]
+
+_BINARY_TYPES = (bytes, bytearray, memoryview)
+
+
+def _is_array_like(obj):
+    return hasattr(obj, "shape") and hasattr(obj, "dtype")
+
+
+def _array_summary(obj):
+    return "<%s shape=%s dtype=%s>" % (
+        type(obj).__name__, tuple(obj.shape), obj.dtype)
+
+
+def _binary_summary(obj, max_length):
+    data = bytes(obj[:max_length])
+    if len(obj) > max_length:
+        return "<%s len=%d: %r...>" % (type(obj).__name__, len(obj), data)
+    return "<%s len=%d: %r>" % (type(obj).__name__, len(obj), data)
+
+
+class _BoundedRepr(reprlib.Repr):
+
+    def __init__(self, max_length, max_items, max_depth):
+        super(_BoundedRepr, self).__init__()
+        self.maxlevel = max_depth
+        self.maxstring = max_length
+        self.maxother = max_length
+        self.maxlong = max_length
+        self.maxlist = self.maxtuple = self.maxset = max_items
+        self.maxfrozenset = self.maxdeque = self.maxarray = max_items
+        self.maxdict = max_items
+        self._max_bytes = max_length // 4
+
+    def repr1(self, x, level):
+        if _is_array_like(x):
+            return _array_summary(x)
+        if isinstance(x, _BINARY_TYPES):
+            return _binary_summary(x, self._max_bytes)
+        return super(_BoundedRepr, self).repr1(x, level)
+
+
+class CapturePolicy:
+    """ How keyword arguments are rendered. """
+
+    def __init__(self, max_length=1000, max_items=100, max_depth=6,
+                 mode="repr"):
+        self.max_length = max_length
+        self.lazy = mode == "lazy"
+        self._repr = _BoundedRepr(max_length, max_items, max_depth)
+
+    def render(self, value):
+        """ Bounded representation of value. """
+        try:
+            text = self._repr.repr(value)
+        except Exception:   # pylint: disable=broad-except
+            return "<unrepresentable %s>" % type(value).__name__
+        if len(text) > self.max_length:
+            text = text[:self.max_length - 3] + "..."
+        return text
+
+    @staticmethod
+    def summary(value):
+        """ Cheap description of value that does not call its repr. """
+        if value is None or isinstance(value, (bool, int, float)):
+            return repr(value)
+        if isinstance(value, str) and len(value) <= 40:
+            return repr(value)
+        if _is_array_like(value):
+            return _array_summary(value)
+        try:
+            return "<%s len=%d>" % (type(value).__name__, len(value))
+        except Exception:   # pylint: disable=broad-except
+            return "<%s>" % type(value).__name__
+
+    def capture(self, names, values):
+        """ Return (args, refs): the rendered "name=value" arguments of a
+            keyword and, in lazy mode, references for render_refs(). """
+        if self.lazy and names:
+            args = ["%s=%s" % (name, self.summary(value))
+                    for name, value in zip(names, values)]
+            return args, (names, values)
+        args = ["%s=%s" % (name, self.render(value))
+                for name, value in zip(names, values)]
+        return args, None
+
+    def render_refs(self, refs):
+        names, values = refs
+        return ", ".join("%s=%s" % (name, self.render(value))
+                         for name, value in zip(names, values))
@@ -0,0 +1,193 @@
+""" Folding of repeated keywords.
+
+Consecutive passing calls of the same keyword under the same parent, e.g.
+a polling helper called in a retry loop, are written as one folded keyword.
+The folded keyword carries the number of calls and their total, minimum
+and maximum duration, and contains the first and the last call in full.
+Failed calls are never folded.
+
+To be able to fold, each keyword is held in memory until it has finished
+and the next sibling event shows whether the keyword was repeated. Keywords
+with more than max_buffered events are not candidates for folding; they are
+written out as they go, and their contents are folded.
+"""
+
+from .output import EventRecorder
+
+
+class _Run:
+    """ Consecutive identical passing keywords that have not been written
+        yet. """
+
+    def __init__(self, key, recording):
+        self.key = key
+        self.first = recording
+        self.last = None
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.add(recording)
+
+    def add(self, recording):
+        duration = recording.endtime - recording.starttime
+        self.count += 1
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+        if self.count > 1:
+            self.last = recording
+
+
+def _keyword_key(recording):
+    _, args, _ = recording.events[0]
+    name, kwtype, _ = args
+    return (name, kwtype)
+
+
+def _keyword_passed(recording):
+    _, args, _ = recording.events[-1]
+    error_msg, = args
+    return not error_msg
+
+
+class FoldingOutput:
+    """ Output wrapper that folds repeated keywords before passing the events
+        on to output. """
+
+    def __init__(self, output, max_buffered=200):
+        self._output = output
+        self._max_buffered = max_buffered
+        # pending run of each open element that is written out, innermost
+        # last; index 0 is the top level
+        self._runs = [None]
+        # keyword being held in memory, and the nesting depth within it
+        self._recording = None
+        self._depth = 0
+
+    def open(self):
+        self._output.open()
+
+    def close(self):
+        if self._recording is not None:
+            self._write_recording()
+        while len(self._runs) > 1:
+            self._flush()
+            self._runs.pop()
+        self._flush()
+        self._output.close()
+
+    # Pending runs
+
+    def _flush(self):
+        """ Write the pending run of the innermost written element. """
+        run = self._runs[-1]
+        if run is None:
+            return
+        self._runs[-1] = None
+
+        if run.count == 1:
+            run.first.replay(self._output)
+            return
+
+        name, kwtype = run.key
+        _, (_, _, args), _ = run.first.events[0]
+        self._output.start_keyword(
+            "%s (folded %d calls)" % (name, run.count), kwtype, args,
+            timestamp=run.first.starttime)
+        self._output.log_message(
+            "Folded %d consecutive calls of %s: total %.3f s, min %.3f s, "
+            "max %.3f s. First and last call shown." % (
+                run.count, name, run.total, run.min, run.max),
+            timestamp=run.first.starttime)
+        run.first.replay(self._output)
+        run.last.replay(self._output)
+        self._output.end_keyword(timestamp=run.last.endtime)
+
+    def _completed(self, recording):
+        """ Handle a keyword that was held in memory and has now ended. """
+        key = _keyword_key(recording)
+        run = self._runs[-1]
+        if not _keyword_passed(recording):
+            self._flush()
+            recording.replay(self._output)
+        elif run is not None and run.key == key:
+            run.add(recording)
+        else:
+            self._flush()
+            self._runs[-1] = _Run(key, recording)
+
+    def _write_recording(self):
+        """ Stop holding the current keyword and write out what has been
+            recorded so far; it stays open. """
+        recording = self._recording
+        self._recording = None
+        self._depth = 0
+
+        self._flush()
+        _, args, timestamp = recording.events[0]
+        self._runs.append(None)
+        self._output.start_keyword(*args, timestamp=timestamp)
+        # the rest of the events get folded like new ones
+        recording.replay(self, recording.events[1:])
+
+    def _record(self, method, *args, **kwargs):
+        """ Record an event of the held keyword. Return True if the event
+            was recorded. """
+        if self._recording is None:
+            return False
+        getattr(self._recording, method)(*args, **kwargs)
+        if method == "start_keyword":
+            self._depth += 1
+        elif method == "end_keyword":
+            self._depth -= 1
+            if self._depth == 0:
+                recording = self._recording
+                self._recording = None
+                self._completed(recording)
+                return True
+
+        if len(self._recording) > self._max_buffered:
+            self._write_recording()
+        return True
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        self._flush()
+        self._runs.append(None)
+        self._output.start_suite(name, timestamp=timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._flush()
+        self._runs.pop()
+        self._output.end_suite(metadata, timestamp=timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._flush()
+        self._runs.append(None)
+        self._output.start_test(name, doc, tags, timestamp=timestamp)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._flush()
+        self._runs.pop()
+        self._output.end_test(error_msg, tags, timestamp=timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        if self._record("start_keyword", name, kwtype, args, timestamp):
+            return
+        self._recording = EventRecorder()
+        self._record("start_keyword", name, kwtype, args, timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        if self._record("end_keyword", error_msg, timestamp):
+            return
+        self._flush()
+        self._runs.pop()
+        self._output.end_keyword(error_msg, timestamp=timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        if self._record("log_message", msg, level, timestamp):
+            return
+        self._flush()
+        self._output.log_message(msg, level, timestamp=timestamp)
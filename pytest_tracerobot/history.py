@@ -0,0 +1,149 @@
+""" Local timing history.
+
+TimingHistory keeps the durations of tests and fixtures of earlier runs in
+an SQLite database, keyed by pytest node id. Under pytest-xdist, the
+workers of a session record into one run. The durations of the latest
+runs are the baseline for a test: a test that takes clearly longer than
+its baseline is tagged "regressed", and a test that is clearly faster is
+tagged "improved". The baselines can also be used to run the slowest tests
+first.
+
+A duration deviates clearly from the baseline if the baseline has at least
+min_runs durations, and the difference to their mean exceeds both
+min_delta seconds and three standard deviations (at least 10% of the mean).
+"""
+
+import math
+import sqlite3
+import time
+
+REGRESSED_TAG = "regressed"
+IMPROVED_TAG = "improved"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    session TEXT
+);
+CREATE TABLE IF NOT EXISTS durations (
+    run INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    nodeid TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS durations_by_nodeid
+    ON durations (kind, nodeid, run);
+"""
+
+# Indexes that need the columns added to earlier databases
+_INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS runs_by_session ON runs (session);
+"""
+
+
+class Baseline:
+    """ Mean and standard deviation of earlier durations. """
+
+    __slots__ = ("mean", "stdev", "count")
+
+    def __init__(self, durations):
+        self.count = len(durations)
+        self.mean = sum(durations) / self.count
+        self.stdev = math.sqrt(
+            sum((d - self.mean) ** 2 for d in durations) / self.count)
+
+    def __str__(self):
+        return "%.3f s (mean of %d runs, stdev %.3f s)" % (
+            self.mean, self.count, self.stdev)
+
+
+class TimingHistory:
+    """ Durations of tests and fixtures across runs. """
+
+    def __init__(self, path, window=10, keep_runs=100, min_runs=3,
+                 min_delta=0.05):
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.executescript(_SCHEMA)
+        columns = [row[1] for row in
+                   self._db.execute("PRAGMA table_info(runs)").fetchall()]
+        if "session" not in columns:
+            self._db.execute("ALTER TABLE runs ADD COLUMN session TEXT")
+        self._db.executescript(_INDEXES)
+        self._window = window
+        self._keep_runs = keep_runs
+        self._min_runs = min_runs
+        self._min_delta = min_delta
+        self._run = None
+        # (kind, nodeid, duration) of this run, written at close
+        self._pending = []
+
+    def close(self):
+        if self._run is not None and self._pending:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO durations VALUES (?, ?, ?, ?)",
+                    [(self._run, kind, nodeid, duration)
+                     for kind, nodeid, duration in self._pending])
+                oldest = self._db.execute(
+                    "SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?",
+                    (self._keep_runs - 1,)).fetchone()
+                if oldest is not None:
+                    self._db.execute("DELETE FROM durations WHERE run < ?",
+                                     oldest)
+                    self._db.execute("DELETE FROM runs WHERE id < ?", oldest)
+        self._db.close()
+
+    def start_run(self, session=None):
+        """ Start recording a run. Processes that give the same session id,
+            e.g. the pytest-xdist workers of one session, share the run. """
+        with self._db:
+            if session is None:
+                self._run = self._db.execute(
+                    "INSERT INTO runs (started) VALUES (?)",
+                    (time.time(),)).lastrowid
+                return
+            query = "SELECT id FROM runs WHERE session = ?"
+            row = self._db.execute(query, (session,)).fetchone()
+            if row is None:
+                # another worker may have just inserted it
+                self._db.execute(
+                    "INSERT OR IGNORE INTO runs (started, session) "
+                    "VALUES (?, ?)", (time.time(), session))
+                row = self._db.execute(query, (session,)).fetchone()
+            self._run = row[0]
+
+    def record(self, nodeid, duration, kind="test"):
+        self._pending.append((kind, nodeid, duration))
+
+    def baseline(self, nodeid, kind="test"):
+        """ Return the Baseline of nodeid, or None if it has no history. """
+        rows = self._db.execute(
+            "SELECT duration FROM durations WHERE kind = ? AND nodeid = ? "
+            "AND run != ? ORDER BY run DESC LIMIT ?",
+            (kind, nodeid, self._run or -1, self._window)).fetchall()
+        if not rows:
+            return None
+        return Baseline([row[0] for row in rows])
+
+    def baselines(self, kind="test"):
+        """ Return the mean duration of each node id with history. """
+        rows = self._db.execute(
+            "SELECT nodeid, AVG(duration) FROM ("
+            "  SELECT nodeid, duration, ROW_NUMBER() OVER ("
+            "    PARTITION BY nodeid ORDER BY run DESC) AS latest"
+            "  FROM durations WHERE kind = ?) "
+            "WHERE latest <= ? GROUP BY nodeid",
+            (kind, self._window)).fetchall()
+        return dict(rows)
+
+    def classify(self, duration, baseline):
+        """ Return the trend tag of duration, or None. """
+        if baseline is None or baseline.count < self._min_runs:
+            return None
+        limit = max(3 * baseline.stdev, 0.1 * baseline.mean, self._min_delta)
+        if duration > baseline.mean + limit:
+            return REGRESSED_TAG
+        if duration < baseline.mean - limit:
+            return IMPROVED_TAG
+        return None
@@ -0,0 +1,149 @@
+""" Event journal.
+
+With --robot-journal, the plugin does not build XML during the run. Instead,
+JournalWriter appends each output event as one JSON line to a journal file:
+
+    ["start_test", 1580471101.123, "test_foo", null, ["passing"]]
+
+that is, the method name, the timestamp and the arguments of the event. The
+journal is flushed after each test and suite, so if the pytest process gets
+killed, the journal still holds everything up to the last finished test.
+
+convert_journal() turns a journal into Robot Framework XML. A truncated
+journal is converted up to its last complete line, and elements that were
+left open are ended as interrupted. If the tests of a suite did not run one
+after another, each suite is written once with all of its tests (see
+suitemerge.py), so the plugin does not need to hold the output back until
+the end of the session. The tracerobot-convert command does the same from
+the command line:
+
+    tracerobot-convert journal.jsonl output.xml
+"""
+
+import argparse
+import json
+import time
+
+from .output import INTERRUPTED, RobotXmlWriter
+from .suitemerge import SuiteMergingOutput
+
+
+class JournalWriter:
+    """ Output that appends events to a JSON lines journal. """
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._encoder = json.JSONEncoder(
+            ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def open(self):
+        self._file = open(self._path, "w", encoding="UTF-8")
+
+    def close(self):
+        self._file.close()
+        self._file = None
+
+    def flush(self):
+        self._file.flush()
+
+    def _event(self, method, timestamp, *args):
+        self._file.write(self._encoder.encode(
+            (method, timestamp or time.time()) + args) + "\n")
+
+    def start_suite(self, name, timestamp=None):
+        self._event("start_suite", timestamp, name)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._event("end_suite", timestamp, metadata)
+        self._file.flush()
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._event("start_test", timestamp, name, doc, tags)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._event("end_test", timestamp, error_msg, tags)
+        self._file.flush()
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._event("start_keyword", timestamp, name, kwtype, args)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._event("end_keyword", timestamp, error_msg)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        self._event("log_message", timestamp, msg, level)
+
+
+_METHODS = ("start_suite", "end_suite", "start_test", "end_test",
+            "start_keyword", "end_keyword", "log_message")
+
+
+def read_journal(path):
+    """ Yield (method, args, timestamp) of each event in the journal at path.
+        Reading stops at the first incomplete or invalid line. """
+    with open(path, encoding="UTF-8", errors="replace") as journal:
+        for line in journal:
+            if not line.endswith("\n"):
+                return
+            try:
+                method, timestamp, *args = json.loads(line)
+            except ValueError:
+                return
+            if method not in _METHODS:
+                return
+            yield method, args, timestamp
+
+
+def _suites_started_once(path):
+    """ Return True if each suite of the journal at path is started only
+        once. """
+    suites = []
+    started = set()
+    for method, args, _ in read_journal(path):
+        if method == "start_suite":
+            suites.append(args[0])
+            if tuple(suites) in started:
+                return False
+            started.add(tuple(suites))
+        elif method == "end_suite" and suites:
+            suites.pop()
+    return True
+
+
+def convert_journal(journal_path, output_path):
+    """ Write the events of a journal as Robot Framework XML. """
+    output = RobotXmlWriter(output_path)
+    if not _suites_started_once(journal_path):
+        output = SuiteMergingOutput(output)
+        output.spool()
+    output.open()
+    try:
+        # tests and keywords that are open, as "test" or "keyword"
+        elements = []
+        for method, args, timestamp in read_journal(journal_path):
+            getattr(output, method)(*args, timestamp=timestamp)
+            if method in ("start_test", "start_keyword"):
+                elements.append(method[len("start_"):])
+            elif method in ("end_test", "end_keyword") and elements:
+                elements.pop()
+        for kind in reversed(elements):
+            getattr(output, "end_" + kind)(INTERRUPTED)
+    finally:
+        output.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="tracerobot-convert",
+        description="Convert a pytest-tracerobot event journal to Robot "
+                    "Framework output XML.")
+    parser.add_argument("journal", help="journal file (--robot-journal)")
+    parser.add_argument("output", nargs="?", default="output.xml",
+                        help="output XML file (default: output.xml)")
+    args = parser.parse_args(argv)
+    convert_journal(args.journal, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+""" Helpers for forwarding Python logging records to the output.
+
+TraceRobotPythonLogger is the logging handler that forwards the records.
+LoggerLevels decides which records are forwarded, based on a default level
+and per-logger levels. LogQueue keeps the logging handler away from the
+output: the handler only formats the record and puts the message into a
+queue, and a writer thread writes it to the output. Each output event
+waits until the messages logged before it have been written, so each
+message stays within the keyword it was logged in. Messages are formatted
+by the logging thread, as their arguments may be changed after logging.
+
+LogFlood suppresses floods of log records. Identical consecutive records
+(same logger, level and message template) are folded into one message with
+a repeat count and time span. Records below WARNING can additionally be
+limited by a per-test budget and a per-logger rate; the number of records
+dropped is logged at the end of the test. WARNING and above are never
+dropped.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+
+def parse_level(level):
+    """ Convert a level name or number to a logging level number. """
+    if isinstance(level, int):
+        return level
+    if level.isdigit():
+        return int(level)
+    value = logging.getLevelName(level.upper())
+    if not isinstance(value, int):
+        raise ValueError("Unknown log level: %s" % level)
+    return value
+
+
+def format_message(record):
+    """ Return the message of record, also if its arguments do not match
+        the message. A message formatted earlier (record.message) is kept,
+        as the arguments may have been changed since. """
+    message = record.__dict__.get("message")
+    if message is not None:
+        return message
+    try:
+        return record.getMessage()
+    except Exception:   # pylint: disable=broad-except
+        return "%s (arguments: %r)" % (record.msg, record.args)
+
+
+class LoggerLevels:
+    """ Log levels per logger name.
+
+        Specs are given as "name=LEVEL", e.g. "urllib3=WARNING". A spec
+        applies to the named logger and its children; the most specific one
+        wins. Loggers without a spec use the default level.
+    """
+
+    def __init__(self, default="DEBUG", specs=None):
+        self.default = parse_level(default)
+        self._levels = {}
+        for spec in specs or []:
+            name, _, level = spec.rpartition("=")
+            if not name:
+                raise ValueError("Invalid log filter (expected "
+                                 "name=LEVEL): %s" % spec)
+            self._levels[name.strip()] = parse_level(level.strip())
+        self._cache = {}
+
+    @property
+    def minimum(self):
+        """ Lowest level that any logger is forwarded at. """
+        return min([self.default] + list(self._levels.values()))
+
+    def level_for(self, name):
+        level = self._cache.get(name)
+        if level is None:
+            level = self.default
+            lookup = name
+            while lookup:
+                if lookup in self._levels:
+                    level = self._levels[lookup]
+                    break
+                lookup = lookup.rpartition(".")[0]
+            self._cache[name] = level
+        return level
+
+    def enabled(self, record):
+        return record.levelno >= self.level_for(record.name)
+
+
+class TraceRobotPythonLogger(logging.Handler):
+    """ Logging handler that writes records to output. """
+
+    LOG_LEVELS = {
+        logging.CRITICAL:   "CRITICAL",
+        logging.ERROR:      "ERROR",
+        logging.WARNING:    "WARNING",
+        logging.INFO:       "INFO",
+        logging.DEBUG:      "DEBUG"
+    }
+
+    def __init__(self, output, levels=None, log_sink=None):
+        super(TraceRobotPythonLogger, self).__init__()
+        self._output = output
+        self._levels = levels
+        # called with the records instead of writing them to output, e.g.
+        # LogQueue.put or the log_record method of lanes (see threads.py)
+        self._sink = log_sink
+
+    def set_levels(self, levels):
+        self._levels = levels
+
+    def handle(self, record):
+        if self._levels is not None and not self._levels.enabled(record):
+            return False
+        if self._sink is not None:
+            self._sink(record)
+        else:
+            self._output.log_message(format_message(record),
+                                     level=record.levelname,
+                                     timestamp=record.created)
+        return True
+
+
+class LogQueue:
+    """ Output wrapper that receives log records through put() and writes
+        them to output on a writer thread. Each output event first waits
+        until the messages put before it have been written. """
+
+    def __init__(self, output):
+        self._output = output
+        self._queue = queue.Queue()
+        # held while writing to output, by the writer thread and by events
+        self._lock = threading.Lock()
+        self._thread = None
+        self._error = None
+
+    def open(self):
+        self._output.open()
+        self._thread = threading.Thread(target=self._write_messages,
+                                        name="tracerobot-log-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._drain()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._output.close()
+
+    def put(self, record):
+        # formatted right away, as the arguments may be changed later
+        self._queue.put(
+            (format_message(record), record.levelname, record.created))
+
+    def _write_messages(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                msg, level, created = item
+                with self._lock:
+                    self._output.log_message(msg, level, timestamp=created)
+            except Exception as err:    # pylint: disable=broad-except
+                # raised by the next output event
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def _drain(self):
+        """ Wait until the messages put so far have been written. """
+        self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        self._drain()
+        with self._lock:
+            self._output.start_suite(name, timestamp=timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._drain()
+        with self._lock:
+            self._output.end_suite(metadata, timestamp=timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._drain()
+        with self._lock:
+            self._output.start_test(name, doc, tags, timestamp=timestamp)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._drain()
+        with self._lock:
+            self._output.end_test(error_msg, tags, timestamp=timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._drain()
+        with self._lock:
+            self._output.start_keyword(name, kwtype, args,
+                                       timestamp=timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._drain()
+        with self._lock:
+            self._output.end_keyword(error_msg, timestamp=timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        self._drain()
+        with self._lock:
+            self._output.log_message(msg, level, timestamp=timestamp)
+
+
+class _Repeat:
+    """ Identical consecutive log records. """
+
+    __slots__ = ("key", "record", "message", "count", "last")
+
+    def __init__(self, key, record):
+        self.key = key
+        self.record = record
+        # formatted right away, as the arguments may be changed later
+        self.message = format_message(record)
+        self.count = 1
+        self.last = record.created
+
+
+class _RateLimit:
+    """ Token bucket of one logger: rate records per second, with bursts of
+        up to rate records. """
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, rate):
+        self.tokens = rate
+        self.updated = None
+
+    def allow(self, rate, now):
+        """ now: creation time of the record. Records of threads and tasks
+            arrive when their lane is written, so time may go backwards. """
+        if self.updated is not None and now > self.updated:
+            self.tokens = min(rate,
+                              self.tokens + (now - self.updated) * rate)
+        if self.updated is None or now > self.updated:
+            self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LogFlood:
+    """ Output wrapper that receives log records through put(), like
+        LogQueue, and passes them on to output with floods suppressed.
+
+        fold: fold identical consecutive records.
+        budget: records below WARNING written per test at most.
+        rate: records below WARNING written per second and logger at most.
+        log_queue: LogQueue that the records are passed to, instead of
+        formatting them here.
+    """
+
+    def __init__(self, output, fold=True, budget=None, rate=None,
+                 log_queue=None):
+        self._output = output
+        self._fold = fold
+        self._budget = budget
+        self._rate = rate
+        self._queue = log_queue
+        self._lock = threading.RLock()
+        self._pending = None
+        self._limits = {}
+        self._written = 0
+        self._suppressed = 0
+
+    def open(self):
+        self._output.open()
+
+    def close(self):
+        self._flush()
+        self._output.close()
+
+    def put(self, record):
+        with self._lock:
+            key = (record.name, record.levelno, record.msg)
+            pending = self._pending
+            if pending is not None and pending.key == key:
+                pending.count += 1
+                pending.last = record.created
+                return
+            self._flush()
+
+            if record.levelno < logging.WARNING and not self._allow(record):
+                self._suppressed += 1
+                return
+            self._written += 1
+            if self._fold:
+                self._pending = _Repeat(key, record)
+            else:
+                self._write(record)
+
+    def _allow(self, record):
+        if self._budget is not None and self._written >= self._budget:
+            return False
+        if self._rate is not None:
+            limit = self._limits.get(record.name)
+            if limit is None:
+                limit = self._limits[record.name] = _RateLimit(self._rate)
+            return limit.allow(self._rate, record.created)
+        return True
+
+    def _write(self, record):
+        if self._queue is not None:
+            # keeps the order of the records that are still being formatted
+            self._queue.put(record)
+        else:
+            self._output.log_message(format_message(record),
+                                     record.levelname,
+                                     timestamp=record.created)
+
+    def _flush(self):
+        """ Write the pending folded record. """
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if pending is None:
+                return
+            record = pending.record
+            message = pending.message
+            if pending.count > 1:
+                message = "%s (repeated %d times in %.3f s)" % (
+                    message, pending.count, pending.last - record.created)
+            self._write(logging.makeLogRecord(
+                dict(record.__dict__, msg=message, args=None,
+                     message=message)))
+
+    def _end_test(self, timestamp):
+        with self._lock:
+            self._flush()
+            if self._suppressed:
+                self._write(logging.makeLogRecord({
+                    "msg": "%d log messages suppressed" % self._suppressed,
+                    "levelname": "INFO", "levelno": logging.INFO,
+                    "created": timestamp or time.time()}))
+            self._written = self._suppressed = 0
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        self._flush()
+        self._output.start_suite(name, timestamp=timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._flush()
+        self._output.end_suite(metadata, timestamp=timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        with self._lock:
+            self._flush()
+            self._written = self._suppressed = 0
+        self._output.start_test(name, doc, tags, timestamp=timestamp)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._end_test(timestamp)
+        self._output.end_test(error_msg, tags, timestamp=timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._flush()
+        self._output.start_keyword(name, kwtype, args, timestamp=timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._flush()
+        self._output.end_keyword(error_msg, timestamp=timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        self._flush()
+        self._output.log_message(msg, level, timestamp=timestamp)
@@ -0,0 +1,315 @@
+""" Merging of Robot Framework XML outputs.
+
+Used for combining the per-worker output shards of a pytest-xdist run into
+a single output.xml. Suites with the same name at the same level are merged
+into one suite, so a test file whose tests were split across workers ends
+up as one suite in the combined output. Suites that one worker entered more
+than once are merged as well.
+
+update_output() adds suite metadata and test tags to an output written
+earlier.
+"""
+
+import copy
+import xml.etree.ElementTree as ET
+from collections import deque
+
+# Elements that follow the child suites/tests/keywords of a suite element
+_SUITE_TRAILER = ("doc", "metadata", "status")
+
+# Attribute that holds the node id of a test while outputs are merged
+_NODEID = "nodeid"
+
+
+def _suite_name(elem):
+    return elem.get("name", "")
+
+
+def _trailer_index(suite):
+    """ Index at which new child suites/tests are to be inserted. """
+    for index, child in enumerate(suite):
+        if child.tag in _SUITE_TRAILER:
+            return index
+    return len(suite)
+
+
+def _merge_status(target, source):
+    """ Combine status of two suite elements: earliest start, latest end,
+        and FAIL if either of them failed. """
+    target_status = target.find("status")
+    source_status = source.find("status")
+    if source_status is None:
+        return
+    if target_status is None:
+        target.append(copy.copy(source_status))
+        return
+
+    if source_status.get("status") == "FAIL":
+        target_status.set("status", "FAIL")
+
+    for attr, pick in (("starttime", min), ("endtime", max)):
+        times = [t for t in (target_status.get(attr), source_status.get(attr))
+                 if t and t != "N/A"]
+        if times:
+            target_status.set(attr, pick(times))
+
+
+def merge_suite(target, source):
+    """ Merge the children of suite element source into suite element target.
+    """
+    for child in list(source):
+        if child.tag in _SUITE_TRAILER:
+            continue
+        if child.tag == "suite":
+            add_suite(target, child)
+        else:
+            target.insert(_trailer_index(target), child)
+
+    _merge_status(target, source)
+
+
+def add_suite(parent, suite):
+    """ Add suite element under parent, merging it with an existing child
+        suite of the same name. """
+    for existing in parent.findall("suite"):
+        if _suite_name(existing) == _suite_name(suite):
+            merge_suite(existing, suite)
+            return
+    parent.insert(_trailer_index(parent), suite)
+    _merge_status(parent, suite)
+
+
+def collapse_suites(suite):
+    """ Merge child suites of the same name, e.g. a suite that a worker
+        entered twice, recursively. """
+    first = {}
+    for child in suite.findall("suite"):
+        existing = first.setdefault(_suite_name(child), child)
+        if existing is not child:
+            suite.remove(child)
+            merge_suite(existing, child)
+    for child in suite.findall("suite"):
+        collapse_suites(child)
+
+
+def _nodeid_key(nodeid):
+    """ Return the suite path tuple and the test name of a node id. """
+    parts = nodeid.split("::")
+    return tuple(parts[0].split("/")), parts[-1]
+
+
+def _set_nodeids(suite, started, path=()):
+    """ Set the node ids of the tests under suite. started maps the suite
+        path and the name of tests to their node ids, in the order they
+        were started. Tests of the same name in one suite, e.g. in
+        different classes, are told apart by that order. """
+    path = path + (_suite_name(suite),)
+    for child in suite:
+        if child.tag == "suite":
+            _set_nodeids(child, started, path)
+        elif child.tag == "test":
+            queue = started.get((path, child.get("name")))
+            if queue:
+                child.set(_NODEID, queue.popleft())
+
+
+def sort_suite(suite, order, path=()):
+    """ Sort child suites and tests according to order, which maps node ids
+        to their collection index. Tests without a node id (see
+        merge_outputs) are looked up by their suite path and name. """
+    path = path + (_suite_name(suite),)
+
+    def rank(elem):
+        if elem.tag == "test":
+            nodeid = elem.get(_NODEID) or "%s::%s" % (
+                "/".join(path), elem.get("name"))
+            return order.get(nodeid, len(order))
+        if elem.tag == "suite":
+            ranks = [rank(child) for child in elem
+                     if child.tag in ("suite", "test")]
+            return min(ranks, default=len(order))
+        return len(order)
+
+    children = [c for c in suite if c.tag in ("suite", "test")]
+    for child in children:
+        suite.remove(child)
+        if child.tag == "suite":
+            sort_suite(child, order, path)
+
+    children.sort(key=rank)
+    # keep suite setup keyword (if any) first
+    index = len([c for c in suite if c.tag == "kw" and c.get("type") == "setup"])
+    for offset, child in enumerate(children):
+        suite.insert(index + offset, child)
+
+
+def _renumber(suite, suite_id):
+    suite.set("id", suite_id)
+    suites = 0
+    tests = 0
+    for child in suite:
+        if child.tag == "suite":
+            suites += 1
+            _renumber(child, "%s-s%d" % (suite_id, suites))
+        elif child.tag == "test":
+            tests += 1
+            child.set("id", "%s-t%d" % (suite_id, tests))
+
+
+def _count(suite):
+    passed = failed = 0
+    for test in suite.iter("test"):
+        status = test.find("status")
+        if status is not None and status.get("status") == "PASS":
+            passed += 1
+        else:
+            failed += 1
+    return passed, failed
+
+
+def _statistics(root_suite):
+    stats = ET.Element("statistics")
+    total = ET.SubElement(stats, "total")
+    passed, failed = _count(root_suite)
+    for label in ("Critical Tests", "All Tests"):
+        stat = ET.SubElement(total, "stat", {
+            "pass": str(passed), "fail": str(failed)})
+        stat.text = label
+    ET.SubElement(stats, "tag")
+    suite_stats = ET.SubElement(stats, "suite")
+    for suite in root_suite.iter("suite"):
+        passed, failed = _count(suite)
+        stat = ET.SubElement(suite_stats, "stat", {
+            "pass": str(passed), "fail": str(failed),
+            "id": suite.get("id"), "name": _suite_name(suite)})
+        stat.text = _suite_name(suite)
+    return stats
+
+
+def merge_outputs(paths, output_path, order=None, nodeids=None):
+    """ Merge Robot XML files in paths into output_path.
+
+        Root suites with the same name are merged into one. If the root suites
+        have different names, they are put under a new combined root suite,
+        similarly to rebot. Optional order (see sort_suite) restores the
+        collection order of suites and tests. Optional nodeids has, for each
+        path, the node ids of its tests in the order they were started, or
+        None; it tells apart tests of the same name in different classes.
+    """
+    roots = []
+    errors = []
+    generator = None
+    generated = None
+    for index, path in enumerate(paths):
+        robot = ET.parse(path).getroot()
+        generator = generator or robot.get("generator")
+        generated = generated or robot.get("generated")
+        if nodeids and nodeids[index]:
+            started = {}
+            for nodeid in nodeids[index]:
+                started.setdefault(
+                    _nodeid_key(nodeid), deque()).append(nodeid)
+            for suite in robot.findall("suite"):
+                _set_nodeids(suite, started)
+        roots.extend(robot.findall("suite"))
+        robot_errors = robot.find("errors")
+        if robot_errors is not None:
+            errors.extend(robot_errors)
+
+    names = []
+    for suite in roots:
+        if _suite_name(suite) not in names:
+            names.append(_suite_name(suite))
+
+    if len(names) == 1:
+        merged = roots[0]
+        for suite in roots[1:]:
+            merge_suite(merged, suite)
+    else:
+        merged = ET.Element("suite", {"name": " & ".join(names)})
+        for suite in roots:
+            add_suite(merged, suite)
+
+    collapse_suites(merged)
+    if order:
+        if len(names) == 1:
+            sort_suite(merged, order)
+        else:
+            for suite in merged.findall("suite"):
+                sort_suite(suite, order)
+    for test in merged.iter("test"):
+        test.attrib.pop(_NODEID, None)
+
+    _renumber(merged, "s1")
+
+    robot = ET.Element("robot", {
+        "generator": generator or "pytest-tracerobot",
+        "generated": generated or "N/A",
+        "rpa": "false"})
+    robot.append(merged)
+    robot.append(_statistics(merged))
+    errors_elem = ET.SubElement(robot, "errors")
+    errors_elem.extend(errors)
+
+    ET.ElementTree(robot).write(
+        output_path, encoding="UTF-8", xml_declaration=True)
+
+
+def _insert_before_status(elem, tag):
+    """ Return the child tag of elem, inserting it before the status if
+        there is none. """
+    child = elem.find(tag)
+    if child is None:
+        status = elem.find("status")
+        index = len(elem) if status is None else list(elem).index(status)
+        child = ET.Element(tag)
+        elem.insert(index, child)
+    return child
+
+
+def update_output(path, metadata=None, tags=None):
+    """ Add suite metadata and test tags to the Robot XML file at path, in
+        a single pass.
+
+        metadata maps the names of top-level suites to dicts of metadata
+        names and values. tags maps test keys to lists of tags. The key of
+        a test is (suite path tuple, test name, n), where n counts the
+        tests before it with the same suite path and name, so that tests of
+        the same name, e.g. in different classes of a file, are told apart.
+    """
+    metadata = metadata or {}
+    tags = tags or {}
+    tree = ET.parse(path)
+    counts = {}
+
+    def visit(suite, suite_path):
+        suite_path = suite_path + (_suite_name(suite),)
+        items = metadata.get(suite_path[0]) if len(suite_path) == 1 else None
+        for child in list(suite):
+            if child.tag == "suite":
+                visit(child, suite_path)
+            elif child.tag == "test":
+                name = child.get("name")
+                count = counts.get((suite_path, name), 0)
+                counts[(suite_path, name)] = count + 1
+                new_tags = tags.get((suite_path, name, count))
+                if new_tags:
+                    elem = _insert_before_status(child, "tags")
+                    for tag in new_tags:
+                        ET.SubElement(elem, "tag").text = tag
+        if items:
+            elem = _insert_before_status(suite, "metadata")
+            for name, value in items.items():
+                ET.SubElement(elem, "item", {"name": name}).text = str(value)
+
+    for suite in tree.getroot().findall("suite"):
+        visit(suite, ())
+    tree.write(path, encoding="UTF-8", xml_declaration=True)
+
+
+def nodeid_order(nodeids):
+    """ Build a sort_suite order mapping from pytest node ids. """
+    order = {}
+    for index, nodeid in enumerate(nodeids):
+        order.setdefault(nodeid, index)
+    return order
@@ -0,0 +1,153 @@
+""" Resource metrics of tests and keywords.
+
+ResourceMetricsOutput measures each test, and each keyword up to a given
+nesting depth, between its start and end events: wall time, process and
+thread CPU time, peak memory allocated by Python (with tracemalloc) and the
+number of garbage collections per generation. The metrics are logged as a
+message at the end of the element. Tests that exceed the time or memory
+budget get the tag "slow" or "memory-heavy".
+
+The peak memory is the highest traced memory use while the element ran,
+relative to the memory in use when it started.
+"""
+
+import gc
+import time
+import tracemalloc
+
+SLOW_TAG = "slow"
+MEMORY_HEAVY_TAG = "memory-heavy"
+
+
+class _Sample:
+    """ Resource counters at the start of a test or keyword. """
+
+    __slots__ = ("measured", "wall", "cpu", "thread_cpu", "memory", "peak",
+                 "collections")
+
+    def __init__(self, measured, trace_memory):
+        self.measured = measured
+        if not measured:
+            return
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.thread_cpu = time.thread_time()
+        self.collections = [stat["collections"] for stat in gc.get_stats()]
+        self.memory = self.peak = 0
+        if trace_memory:
+            self.memory = tracemalloc.get_traced_memory()[0]
+
+
+def _format_bytes(count):
+    if abs(count) < 1024 * 1024:
+        return "%.1f KiB" % (count / 1024.0)
+    return "%.1f MiB" % (count / (1024.0 * 1024.0))
+
+
+class ResourceMetricsOutput:
+    """ Output wrapper that adds resource metrics of tests and keywords.
+
+        keyword_depth: keywords nested at most this deep (1 being the
+        outermost) are measured; 0 measures tests only.
+        slow_budget: wall time in seconds above which a test is tagged slow.
+        memory_budget: peak memory in bytes above which a test is tagged
+        memory-heavy.
+    """
+
+    def __init__(self, output, keyword_depth=1, slow_budget=None,
+                 memory_budget=None, trace_memory=True):
+        self._output = output
+        self._keyword_depth = keyword_depth
+        self._slow_budget = slow_budget
+        self._memory_budget = memory_budget
+        self._trace_memory = trace_memory
+        self._started_tracemalloc = False
+        # samples of the open test and keywords, innermost last
+        self._samples = []
+        self._depth = 0
+
+    def open(self):
+        if self._trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._output.open()
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self._output.close()
+
+    def _start(self, measured):
+        if measured and self._trace_memory:
+            # Keep the peak of the enclosing elements before resetting it
+            peak = tracemalloc.get_traced_memory()[1]
+            for sample in self._samples:
+                if sample.measured:
+                    sample.peak = max(sample.peak, peak)
+            tracemalloc.reset_peak()
+        self._samples.append(_Sample(measured, self._trace_memory))
+
+    def _end(self):
+        """ Return (message, wall time, peak memory) of the element that
+            ends, or None if it is not measured. """
+        sample = self._samples.pop()
+        if not sample.measured:
+            return None
+
+        wall = time.perf_counter() - sample.wall
+        cpu = time.process_time() - sample.cpu
+        thread_cpu = time.thread_time() - sample.thread_cpu
+        collections = [stat["collections"] - before for stat, before in
+                       zip(gc.get_stats(), sample.collections)]
+        parts = ["wall %.3f s" % wall,
+                 "CPU %.3f s (thread %.3f s)" % (cpu, thread_cpu)]
+        peak = None
+        if self._trace_memory:
+            peak = max(sample.peak, tracemalloc.get_traced_memory()[1])
+            for outer in self._samples:
+                if outer.measured:
+                    outer.peak = max(outer.peak, peak)
+            peak -= sample.memory
+            parts.append("peak memory +%s" % _format_bytes(peak))
+        parts.append("GC collections %s" % "/".join(map(str, collections)))
+        return "Resources: " + ", ".join(parts), wall, peak
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        self._output.start_suite(name, timestamp=timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._output.end_suite(metadata, timestamp=timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._output.start_test(name, doc, tags, timestamp=timestamp)
+        self._depth = 0
+        self._start(True)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        msg, wall, peak = self._end()
+        self._output.log_message(msg, timestamp=timestamp)
+
+        tags = list(tags or [])
+        if self._slow_budget is not None and wall > self._slow_budget:
+            tags.append(SLOW_TAG)
+        if (self._memory_budget is not None and peak is not None and
+                peak > self._memory_budget):
+            tags.append(MEMORY_HEAVY_TAG)
+        self._output.end_test(error_msg, tags, timestamp=timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._output.start_keyword(name, kwtype, args, timestamp=timestamp)
+        self._depth += 1
+        self._start(self._depth <= self._keyword_depth)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._depth -= 1
+        result = self._end()
+        if result is not None:
+            self._output.log_message(result[0], timestamp=timestamp)
+        self._output.end_keyword(error_msg, timestamp=timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        self._output.log_message(msg, level, timestamp=timestamp)
@@ -0,0 +1,358 @@
+""" Output writers.
+
+The plugin reports suites, tests, keywords and log messages to an output
+object. All outputs implement the same nested start/end interface; the
+output itself keeps track of the currently open elements, so callers do not
+need to hold on to any handles.
+
+Suites can be given metadata (a dict of names and values), and tests
+additional tags, when they end.
+
+All methods take an optional timestamp (as returned by time.time()), which
+is used instead of the current time when events recorded earlier with
+EventRecorder are replayed.
+
+TraceRobotOutput forwards everything to the tracerobot module, which builds
+and writes the XML. RobotXmlWriter writes Robot Framework compatible XML
+itself, streaming each element to disk as soon as it is complete; its memory
+use depends only on the nesting depth, not on the size of the session.
+"""
+
+import re
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+from .merge import update_output
+
+# Error message of the elements that were left open
+INTERRUPTED = "Execution was interrupted"
+
+
+class TraceRobotOutput:
+    """ Output that delegates to the tracerobot module. """
+
+    def __init__(self, tracerobot_config):
+        # imported only when used, as it imports Robot Framework
+        import tracerobot
+        self._tracerobot = tracerobot
+        self._config = tracerobot_config
+        self._stack = []
+        self._names = []
+        # metadata of top-level suites, by suite name
+        self._metadata = {}
+        # tags added at the end of tests, by test key (see update_output)
+        self._tags = {}
+        # number of tests started, by suite path and test name
+        self._test_counts = {}
+        self._test_key = None
+
+    def open(self):
+        self._tracerobot.tracerobot_init(self._config)
+
+    def close(self):
+        self._tracerobot.close()
+        # tracerobot has no API for suite metadata, so it is added to the
+        # XML file afterwards. Only top-level suites are supported.
+        if self._metadata or self._tags:
+            update_output(self._config["robot_output"], self._metadata,
+                          self._tags)
+
+    # tracerobot always uses the current time, so timestamps are ignored
+
+    def start_suite(self, name, timestamp=None):
+        self._stack.append(self._tracerobot.start_suite(name))
+        self._names.append(name)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._tracerobot.end_suite(self._stack.pop())
+        name = self._names.pop()
+        if metadata and not self._names:
+            self._metadata.setdefault(name, {}).update(metadata)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._stack.append(
+            self._tracerobot.start_test(name=name, doc=doc, tags=tags))
+        key = (tuple(self._names), name)
+        count = self._test_counts.get(key, 0)
+        self._test_counts[key] = count + 1
+        self._test_key = key + (count,)
+        self._names.append(name)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._tracerobot.end_test(self._stack.pop(), error_msg)
+        self._names.pop()
+        if tags:
+            self._tags[self._test_key] = list(tags)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._stack.append(
+            self._tracerobot.start_keyword(name, type=kwtype, args=args))
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._tracerobot.end_keyword(self._stack.pop(), error_msg=error_msg)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        self._tracerobot.log_message(msg, level=level)
+
+
+class EventRecorder:
+    """ Output that records events in memory, so that they can be replayed
+        to another output later. """
+
+    def __init__(self):
+        self.events = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def _record(self, method, args, timestamp):
+        self.events.append((method, args, timestamp or time.time()))
+
+    def start_suite(self, name, timestamp=None):
+        self._record("start_suite", (name,), timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._record("end_suite", (metadata,), timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._record("start_test", (name, doc, tags), timestamp)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._record("end_test", (error_msg, tags), timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._record("start_keyword", (name, kwtype, args), timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._record("end_keyword", (error_msg,), timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        self._record("log_message", (msg, level), timestamp)
+
+    @property
+    def starttime(self):
+        return self.events[0][2]
+
+    @property
+    def endtime(self):
+        return self.events[-1][2]
+
+    def replay(self, output, events=None):
+        for method, args, timestamp in self.events if events is None else events:
+            getattr(output, method)(*args, timestamp=timestamp)
+
+
+# Characters that are not allowed in XML 1.0 documents
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+# Python logging levels that have a different name in Robot Framework
+_ROBOT_LEVELS = {
+    "WARNING": "WARN",
+    "CRITICAL": "ERROR",
+}
+
+
+def _text(value):
+    return escape(_INVALID_XML_CHARS.sub('', str(value)))
+
+
+def _attr(value):
+    return quoteattr(_INVALID_XML_CHARS.sub('', str(value)))
+
+
+def format_timestamp(timestamp):
+    """ Robot Framework timestamp format, e.g. 20200131 13:45:01.123 """
+    millis = int(round(timestamp * 1000)) % 1000
+    return (time.strftime("%Y%m%d %H:%M:%S", time.localtime(timestamp)) +
+            ".%03d" % millis)
+
+
+class _OpenElement:
+    """ Book-keeping for an element that has been started but not ended. """
+    __slots__ = ("tag", "id", "starttime", "failed", "suites", "tests",
+                 "doc", "tags")
+
+    def __init__(self, tag, elem_id, starttime, doc=None, tags=None):
+        self.tag = tag
+        self.id = elem_id
+        self.starttime = starttime
+        self.failed = False
+        self.suites = 0
+        self.tests = 0
+        self.doc = doc
+        self.tags = tags
+
+
+class RobotXmlWriter:
+    """ Streaming Robot Framework XML writer.
+
+        Start tags are written when an element starts and the closing part
+        (documentation, tags, status) when it ends, so nothing but the stack
+        of currently open elements is kept in memory. The file is flushed
+        after each test and suite.
+    """
+
+    GENERATOR = "pytest-tracerobot"
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._stack = []
+        self._passed = 0
+        self._failed = 0
+
+    def open(self):
+        self._file = open(self._path, "w", encoding="UTF-8")
+        self._file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self._file.write('<robot generator=%s generated=%s rpa="false">\n' % (
+            _attr(self.GENERATOR), _attr(format_timestamp(time.time()))))
+
+    def close(self):
+        while self._stack:
+            self._end(self._stack[-1].tag, INTERRUPTED)
+
+        write = self._file.write
+        write('<statistics>\n<total>\n')
+        for label in ("Critical Tests", "All Tests"):
+            write('<stat pass="%d" fail="%d">%s</stat>\n' % (
+                self._passed, self._failed, label))
+        write('</total>\n<tag>\n</tag>\n<suite>\n</suite>\n</statistics>\n')
+        write('<errors>\n</errors>\n</robot>\n')
+        self._file.close()
+        self._file = None
+
+    @property
+    def passed(self):
+        return self._passed
+
+    @property
+    def failed(self):
+        return self._failed
+
+    @property
+    def size(self):
+        """ Number of bytes written so far. """
+        return self._file.tell()
+
+    def _parent(self):
+        return self._stack[-1] if self._stack else None
+
+    def _status(self, elem, endtime, error_msg=None, extra=""):
+        status = "FAIL" if elem.failed else "PASS"
+        self._file.write('<status status="%s" starttime=%s endtime=%s%s>%s'
+                         '</status>\n' % (
+                             status,
+                             _attr(format_timestamp(elem.starttime)),
+                             _attr(format_timestamp(endtime)),
+                             extra,
+                             _text(error_msg) if error_msg else ""))
+
+    def _end(self, tag, error_msg=None, timestamp=None, metadata=None,
+             tags=None):
+        """ End the innermost element, which must be of type tag. """
+        elem = self._stack.pop()
+        assert elem.tag == tag, "expected %s, got %s" % (tag, elem.tag)
+
+        if error_msg:
+            elem.failed = True
+        # A failed keyword does not fail its parent: the test may have
+        # caught the error. The status of a test comes from end_test only.
+        parent = self._parent()
+        if parent is not None and elem.failed and tag != "kw":
+            parent.failed = True
+
+        endtime = timestamp or time.time()
+        if tag == "kw":
+            if error_msg:
+                self._message(error_msg, "FAIL", endtime)
+            self._status(elem, endtime)
+        elif tag == "test":
+            self._test_info(elem.doc, list(elem.tags or []) + list(tags or []))
+            self._status(elem, endtime, error_msg, ' critical="yes"')
+            if elem.failed:
+                self._failed += 1
+            else:
+                self._passed += 1
+        else:
+            if metadata:
+                self._metadata(metadata)
+            self._status(elem, endtime)
+        self._file.write('</%s>\n' % tag)
+
+    def _test_info(self, doc, tags):
+        write = self._file.write
+        if doc:
+            write('<doc>%s</doc>\n' % _text(doc))
+        if tags:
+            write('<tags>\n')
+            for tag in tags:
+                write('<tag>%s</tag>\n' % _text(tag))
+            write('</tags>\n')
+
+    def _metadata(self, metadata):
+        write = self._file.write
+        write('<metadata>\n')
+        for name, value in metadata.items():
+            write('<item name=%s>%s</item>\n' % (_attr(name), _text(value)))
+        write('</metadata>\n')
+
+    def start_suite(self, name, timestamp=None):
+        parent = self._parent()
+        if parent is None:
+            suite_id = "s1"
+        else:
+            parent.suites += 1
+            suite_id = "%s-s%d" % (parent.id, parent.suites)
+        self._stack.append(
+            _OpenElement("suite", suite_id, timestamp or time.time()))
+        self._file.write('<suite id=%s name=%s>\n' % (
+            _attr(suite_id), _attr(name)))
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._end("suite", timestamp=timestamp, metadata=metadata)
+        self._file.flush()
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        parent = self._parent()
+        parent.tests += 1
+        test_id = "%s-t%d" % (parent.id, parent.tests)
+        self._stack.append(
+            _OpenElement("test", test_id, timestamp or time.time(), doc, tags))
+        self._file.write('<test id=%s name=%s>\n' % (
+            _attr(test_id), _attr(name)))
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._end("test", error_msg, timestamp, tags=tags)
+        self._file.flush()
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._stack.append(_OpenElement("kw", None, timestamp or time.time()))
+        write = self._file.write
+        write('<kw name=%s type=%s>\n' % (_attr(name), _attr(kwtype)))
+        if args:
+            write('<arguments>\n')
+            for arg in args:
+                write('<arg>%s</arg>\n' % _text(arg))
+            write('</arguments>\n')
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._end("kw", error_msg, timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        parent = self._parent()
+        if parent is None or parent.tag == "suite":
+            # Robot Framework allows messages only within keywords
+            return
+        if parent.tag == "test":
+            self.start_keyword("Log", timestamp=timestamp)
+            self.log_message(msg, level, timestamp)
+            self.end_keyword(timestamp=timestamp)
+            return
+        self._message(msg, level, timestamp)
+
+    def _message(self, msg, level, timestamp=None):
+        level = _ROBOT_LEVELS.get(level, level)
+        self._file.write('<msg timestamp=%s level=%s>%s</msg>\n' % (
+            _attr(format_timestamp(timestamp or time.time())), _attr(level),
+            _text(msg)))
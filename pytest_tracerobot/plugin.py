@@ -0,0 +1,830 @@
+""" The pytest plugin, registered by pytest_configure when it is enabled. """
+
+import functools
+import os
+import sys
+import time
+import traceback
+import logging
+from contextlib import AbstractContextManager, contextmanager
+import pytest
+import _pytest
+
+from .asserts import AssertRecorder
+from .capture import CapturePolicy
+from .folding import FoldingOutput
+from .history import TimingHistory
+from .journal import JournalWriter, convert_journal
+from .logbridge import (LogFlood, LoggerLevels, LogQueue,
+                        TraceRobotPythonLogger, parse_level)
+from .merge import merge_outputs, nodeid_order
+from .metrics import ResourceMetricsOutput
+from .output import TraceRobotOutput, RobotXmlWriter
+from .profiling import OUTPUT_METHODS, PluginProfiler
+from .rebot import STATUS_NAME, start_rebot
+from .retain import RetainFailedOutput
+from .settings import (MARKER, TraceSettings, get_option, parse_ini_lines,
+                       settings_for)
+from .split import SplitOutput, find_parts
+from .subprocesses import SubprocessTracing
+from .suitemerge import SuiteMergingOutput
+from .teststate import RunningTest, SETUP, BODY, TEARDOWN
+from .threads import TaskLanes, ThreadLanes
+from .tracer import create_autotracer, format_error
+
+# Set to True to enable trace log of some hook calls to stdout
+HOOK_DEBUG = False
+
+def xdist_worker_id(config):
+    """ Return the pytest-xdist worker id (e.g. 'gw0'), or None when not
+        running in a xdist worker process. """
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is None:
+        return None
+    return workerinput["workerid"]
+
+def xdist_session_id(config):
+    """ Return the id that the pytest-xdist workers of a session share, or
+        None when not running in a xdist worker process. """
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is None:
+        return None
+    return workerinput.get("testrunuid")
+
+def is_xdist_controller(config):
+    return (xdist_worker_id(config) is None and
+            getattr(config.option, "dist", "no") != "no")
+
+def shard_path(path, worker_id):
+    """ output.xml -> output.gw0.xml """
+    base, ext = os.path.splitext(path)
+    return base + "." + worker_id + ext
+
+def is_contiguous(paths):
+    """ Return True if suite paths (lists of names) enter each suite only
+        once, i.e. the tests of each suite run one after another. """
+    current = []
+    ended = set()
+    for path in paths:
+        common = common_items(current, path)
+        while len(current) > len(common):
+            ended.add(tuple(current))
+            current.pop()
+        while len(current) < len(path):
+            current.append(path[len(current)])
+            if tuple(current) in ended:
+                return False
+    return True
+
+def common_items(iter1, iter2):
+    common = []
+    for first, second in zip(iter1, iter2):
+        if first != second:
+            break
+        common.append(first)
+    return common
+
+def start_session_rebot(config, output_path, split_dir=None):
+    """ Start rebot on the output of the session as configured with
+        --robot-rebot. Returns (RebotJob or None, status or None); the
+        status is available if the job was waited for. """
+    mode = config.getoption("robot_rebot")
+    if not mode:
+        return None, None
+    if split_dir:
+        outputs = find_parts(split_dir)
+        status_path = os.path.join(split_dir, STATUS_NAME)
+    else:
+        outputs = [output_path] if os.path.exists(output_path) else []
+        status_path = os.path.join(os.path.dirname(output_path), STATUS_NAME)
+    if not outputs:
+        return None, None
+    job = start_rebot(outputs, status_path,
+                      jobs=config.getoption("robot_rebot_jobs"),
+                      background=(mode == "background"))
+    if job is None or mode == "background":
+        return job, None
+    return job, job.wait()
+
+def report_rebot(terminalreporter, job, status):
+    """ Write the state of a rebot job to the terminal summary. """
+    if job is None:
+        return
+    if status is None:
+        terminalreporter.write_line(
+            "tracerobot: generating logs and reports in the background "
+            "(pid %d), status in %s" % (job.pid, job.status_path))
+        return
+    for artifact in status.get("artifacts", []):
+        terminalreporter.write_line("tracerobot: wrote %s" % artifact)
+    for error in status.get("errors", []):
+        terminalreporter.write_line("tracerobot: rebot failed on %s: %s" % (
+            error["output"], error["error"]), red=True)
+
+def is_direct_param(fixturedef):
+    """ Return True if fixturedef is the pseudo fixture that pytest creates
+        for an argument of @pytest.mark.parametrize. """
+    return getattr(fixturedef.func, "__name__", None) == \
+        "get_direct_param_fixture_func"
+
+def cached_error(fixturedef):
+    """ Return the exception of a cached failed fixture setup, or None. """
+    cached = fixturedef.cached_result
+    if len(cached) < 3 or not cached[2]:
+        return None
+    # (exception, traceback) or, before pytest 8, sys.exc_info()
+    for value in cached[2]:
+        if isinstance(value, BaseException):
+            return value
+    return None
+
+def check_log_level(settings):
+    """ Raise ValueError if the log level of settings is not valid. """
+    if settings.log_level is not None:
+        parse_level(settings.log_level)
+
+class KeywordCtx(AbstractContextManager):
+    """ A keyword context class that makes sure that started keywords
+        get closed. """
+
+    def __init__(self, output, name, kwtype="kw", args=None):
+        super(AbstractContextManager, self).__init__()
+        self._name = name
+        self._output = output
+        self._output.start_keyword(name, kwtype=kwtype, args=args)
+        self._error_msg = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._output.end_keyword(error_msg=self._error_msg)
+
+    def set_error_msg(self, error_msg):
+        self._error_msg = error_msg
+
+
+class TraceRobotPlugin:
+    def __init__(self, config):
+
+        self.config = config
+        self._stack = []
+        # RunningTest of each started test, by node id
+        self._tests = {}
+        # names of the fixtures set up for the current test, with True if
+        # their setup failed
+        self._setup_fixtures = {}
+        # (KeywordCtx, tracer was running) of fixtures being torn down
+        self._fixture_teardowns = {}
+        self._output = None
+        self._suite_merger = None
+        self._asserts = None
+        self._tracer = None
+        self._logger = None
+        self._root_log_level = None
+        # LoggerLevels by per-test log level; None is the session level
+        self._log_levels = {}
+        self._session_log_level = None
+        self._output_path = config.getoption("robot_output")
+        self._journal_path = config.getoption("robot_journal")
+        self._split_dir = config.getoption("robot_split")
+        if self._split_dir and self._journal_path:
+            raise pytest.UsageError(
+                "--robot-split and --robot-journal can not be combined")
+        # The tracerobot writer always uses the current time, so options
+        # that write events later need one of the other outputs
+        self._keeps_timestamps = bool(
+            self._journal_path or self._split_dir or
+            config.getoption("robot_writer") == "stream")
+        if config.getoption("robot_fold_keywords"):
+            self._require_timestamps("--robot-fold-keywords")
+        if config.getoption("trace_retain") == "failed":
+            self._require_timestamps("--trace-retain=failed")
+        if config.getoption("autotrace_threads"):
+            self._require_timestamps("--autotrace-threads")
+        if config.getoption("autotrace_subprocesses"):
+            self._require_timestamps("--autotrace-subprocesses")
+        self._defaults = TraceSettings(autotrace=config.getoption("autotrace"))
+        # settings of the running test, or the defaults between tests
+        self._settings = self._defaults
+        try:
+            self._trace_rules = parse_ini_lines(config.getini("robot_trace"))
+            for _, options in self._trace_rules:
+                check_log_level(self._defaults.updated(options))
+        except ValueError as err:
+            raise pytest.UsageError("robot_trace: %s" % err)
+        self._history = None
+        self._subprocesses = None
+        self._profiler = None
+        self._rebot = self._rebot_status = None
+        if config.getoption("tracerobot_profile"):
+            # Hooks must be instrumented before the plugin gets registered
+            self._profiler = PluginProfiler()
+            self._profiler.instrument(
+                self, [name for name in dir(self) if name.startswith("pytest_")],
+                "hook: ")
+
+        # Under pytest-xdist, each worker writes its own shard which the
+        # controller merges at the end of the session
+        worker_id = xdist_worker_id(config)
+        if worker_id is not None:
+            self._output_path = shard_path(self._output_path, worker_id)
+            if self._journal_path:
+                self._journal_path = shard_path(self._journal_path, worker_id)
+            if self._split_dir:
+                self._split_dir = os.path.join(self._split_dir, worker_id)
+        # node ids of the tests in the order they were started, passed to
+        # the xdist controller for merging
+        self._nodeids = [] if worker_id is not None else None
+
+    def _require_timestamps(self, option):
+        if not self._keeps_timestamps:
+            raise pytest.UsageError(
+                "%s requires --robot-writer=stream, --robot-journal or "
+                "--robot-split: the tracerobot writer does not keep the "
+                "timing of events that are written later" % option)
+
+    @property
+    def current_path(self):
+        return list(self._stack)
+
+    def _start_suite(self, name):
+        # TODO: How to get meaningful suite docstring/metadata/source?
+        self._output.start_suite(name)
+        self._stack.append(name)
+
+    def _end_suite(self, metadata=None):
+        self._stack.pop(-1)
+        self._output.end_suite(metadata)
+
+    def _get_error_msg(self, call):
+        if call and call.excinfo:
+            stack_summary = traceback.extract_tb(call.excinfo.tb)
+            frames = traceback.format_list(stack_summary)
+            msg = frames[-1] + "\n" + call.excinfo.exconly()
+            return msg
+
+        else:
+            return None
+
+    def _test_state(self, item):
+        """ Return the RunningTest of item, or None if the test is not
+            running. """
+        return self._tests.get(item.nodeid)
+
+    def _is_test_started(self, item):
+        return item.nodeid in self._tests
+
+    def _is_test_with_setup_and_teardown(self, item):
+        state = self._test_state(item)
+        return state is not None and state.with_setup_and_teardown
+
+    def _start_test_envelope(self, item, with_setup_and_teardown=False):
+        """ test envelope consists of
+                [setup keyword] + test function keyword + [teardown keywords]
+                """
+        if self._is_test_started(item):
+            return
+
+        markers = [marker.name for marker in item.iter_markers()
+                   if marker.name != MARKER]
+
+        self._output.start_test(
+            name=item.name,
+            doc=item.function.__doc__,
+            tags=markers)
+        self._tests[item.nodeid] = RunningTest(with_setup_and_teardown)
+        if self._nodeids is not None:
+            self._nodeids.append(item.nodeid)
+
+        self._apply_settings(
+            settings_for(item, self._defaults, self._trace_rules))
+        if self._settings.autotrace:
+            self._tracer.start()
+        if self._subprocesses:
+            self._subprocesses.start_test()
+
+    def _apply_settings(self, settings):
+        if settings is self._settings:
+            return
+        self._settings = settings
+        self._tracer.use_libpaths(settings.libpaths)
+        self._tracer.max_depth = (
+            sys.maxsize if settings.depth is None else settings.depth)
+
+        levels = self._log_levels.get(settings.log_level)
+        if levels is None:
+            levels = self._log_levels[settings.log_level] = LoggerLevels(
+                settings.log_level,
+                get_option(self.config, "robot_log_filters"))
+        self._logger.set_levels(levels)
+        root = logging.getLogger()
+        root.setLevel(self._session_log_level)
+        if levels.minimum < root.getEffectiveLevel():
+            root.setLevel(levels.minimum)
+
+    def _start_test_setup(self, item):
+        assert self._test_state(item).phase == SETUP
+        self._output.start_keyword("fixture(s)", "setup")
+
+    def _finish_test_setup(self, item, call=None):
+        state = self._test_state(item)
+        if state.phase == SETUP:
+            state.error_msg = self._get_error_msg(call)
+            self._write_cached_fixtures(item)
+            self._output.end_keyword(error_msg=state.error_msg)
+
+    def _write_cached_fixtures(self, item):
+        """ Write a keyword for each fixture of item that was not set up for
+            it, because its cached value of a broader scope was used. """
+        # pytest has no public API for the fixture definitions of an item
+        name2fixturedefs = getattr(
+            getattr(item, "_fixtureinfo", None), "name2fixturedefs", None)
+        if name2fixturedefs is None:
+            return
+        for name in item.fixturenames:
+            if self._setup_fixtures.get(name):
+                # the fixtures after a failed one were not set up
+                break
+            fixturedefs = name2fixturedefs.get(name)
+            if not fixturedefs or name in self._setup_fixtures:
+                continue
+            fixturedef = fixturedefs[-1]
+            if is_direct_param(fixturedef) or \
+                    getattr(fixturedef, "cached_result", None) is None:
+                continue
+            with self._fixture_keyword(fixturedef, "setup",
+                                       cached=True) as fixture_kw:
+                error = cached_error(fixturedef)
+                if error is not None:
+                    fixture_kw.set_error_msg(format_error(error))
+
+    def _start_test_body(self, item):
+        self._test_state(item).advance(BODY)
+
+    def _finish_test_body(self, item, call=None):
+        state = self._test_state(item)
+        assert state.phase == BODY
+        state.error_msg = self._get_error_msg(call)
+
+    def _start_test_teardown(self, item):
+        self._test_state(item).advance(TEARDOWN)
+        self._output.start_keyword("fixture(s)", "teardown")
+
+    def _finish_test_teardown(self, item, call=None):
+        state = self._test_state(item)
+        if state.phase == TEARDOWN:
+            error_msg = self._get_error_msg(call)
+            self._output.end_keyword(error_msg=error_msg)
+            state.teardown_error_msg = error_msg
+
+    def _finish_test_envelope(self, item, call=None):
+        self._tracer.stop()
+        self._apply_settings(self._defaults)
+
+        state = self._tests.pop(item.nodeid, None)
+        if state is not None:
+            if call.excinfo:
+                error_msg = self._get_error_msg(call)
+            else:
+                error_msg = state.combined_error_msg()
+
+            if self._subprocesses:
+                self._subprocesses.end_test()
+            tags = None
+            if self._history:
+                tags = self._compare_to_history(
+                    item.nodeid, state.duration, error_msg)
+            self._output.end_test(error_msg, tags)
+
+    def _compare_to_history(self, nodeid, duration, error_msg):
+        """ Log the baseline duration of the test, record the duration of a
+            passed test, and return its trend tags. """
+        baseline = self._history.baseline(nodeid)
+        if baseline is not None:
+            self._output.log_message("Duration %.3f s, baseline %s" % (
+                duration, baseline))
+        if error_msg:
+            # failed tests often end early, keep them out of the history
+            return None
+        self._history.record(nodeid, duration)
+        tag = self._history.classify(duration, baseline)
+        return [tag] if tag else None
+
+
+    # Initialization hooks
+
+    def pytest_sessionstart(self, session):
+        # note: this becomes after the root-level suite has been created
+        tracerobot_config = {}
+        for var in ["autotrace_privates", "autotrace_libpaths"]:
+            tracerobot_config[var] = self.config.getoption(var)
+        tracerobot_config["robot_output"] = self._output_path
+
+        # add _pytest module to list of silenced paths in order to avoid
+        # logging of asserts related helper methods
+        tracerobot_config['autotrace_silentpaths'] = _pytest.__path__
+
+        if self._journal_path:
+            self._output = JournalWriter(self._journal_path)
+        elif self._split_dir:
+            split_size = self.config.getoption("robot_split_size")
+            self._output = SplitOutput(
+                self._split_dir,
+                depth=self.config.getoption("robot_split_depth"),
+                max_bytes=(split_size * 1024 * 1024
+                           if split_size is not None else None))
+        elif self.config.getoption("robot_writer") == "stream":
+            self._output = RobotXmlWriter(self._output_path)
+        else:
+            self._output = TraceRobotOutput(tracerobot_config)
+        if self._profiler:
+            self._profiler.instrument(self._output, OUTPUT_METHODS, "output: ")
+        self._output = self._suite_merger = SuiteMergingOutput(self._output)
+        if self.config.getoption("robot_fold_keywords"):
+            self._output = FoldingOutput(self._output)
+        if self.config.getoption("trace_retain") == "failed":
+            self._output = RetainFailedOutput(
+                self._output, self.config.getoption("trace_retain_buffer"))
+        log_queue = None
+        if get_option(self.config, "robot_log_queue"):
+            self._output = log_queue = LogQueue(self._output)
+        fold = get_option(self.config, "robot_log_fold")
+        budget = get_option(self.config, "robot_log_budget")
+        rate = get_option(self.config, "robot_log_rate")
+        # 0 is a valid limit: no records below WARNING at all
+        budget = int(budget) if budget not in (None, '') else None
+        rate = float(rate) if rate not in (None, '') else None
+        if fold or budget is not None or rate is not None:
+            # records reach the queue, if any, through the flood control
+            self._output = log_queue = LogFlood(
+                self._output, fold=fold, budget=budget, rate=rate,
+                log_queue=log_queue)
+        if self.config.getoption("robot_metrics"):
+            memory_budget = self.config.getoption("robot_memory_budget")
+            self._output = ResourceMetricsOutput(
+                self._output,
+                keyword_depth=self.config.getoption("robot_metrics_depth"),
+                slow_budget=self.config.getoption("robot_slow_budget"),
+                memory_budget=(memory_budget * 1024 * 1024
+                               if memory_budget is not None else None))
+        log_sink = log_queue.put if log_queue is not None else None
+        # Coroutine keywords stay open while they await, and tasks and
+        # threads are written in lanes, only if the output keeps the timing
+        # of events written later
+        if self._keeps_timestamps:
+            # log records of lanes reach the flood control or the queue
+            # when the lane is written
+            self._output = task_lanes = TaskLanes(self._output, log_sink)
+            if self.config.getoption("autotrace_threads"):
+                self._output = ThreadLanes(self._output,
+                                           task_lanes.log_record)
+            log_sink = self._output.log_record
+        self._output.open()
+        self._asserts = AssertRecorder(
+            self._output, get_option(self.config, "robot_asserts"))
+
+        history_path = get_option(self.config, "robot_history")
+        if history_path:
+            self._history = TimingHistory(history_path)
+            self._history.start_run(xdist_session_id(self.config))
+
+        self._tracer = create_autotracer(
+            self.config.getoption("autotrace_backend"),
+            self._output,
+            libpaths=tracerobot_config["autotrace_libpaths"],
+            silentpaths=tracerobot_config["autotrace_silentpaths"],
+            privates=tracerobot_config["autotrace_privates"],
+            capture=CapturePolicy(
+                max_length=self.config.getoption("autotrace_max_repr"),
+                max_items=self.config.getoption("autotrace_max_items"),
+                max_depth=self.config.getoption("autotrace_max_depth"),
+                mode=self.config.getoption("autotrace_args")),
+            threads=self.config.getoption("autotrace_threads"),
+            coroutines=self._keeps_timestamps)
+        if self._profiler:
+            self._profiler.instrument(
+                self._tracer, self._tracer.CALLBACKS, "tracer: ")
+
+        levels = LoggerLevels(get_option(self.config, "robot_log_level"),
+                              get_option(self.config, "robot_log_filters"))
+        self._log_levels[None] = levels
+        self._logger = TraceRobotPythonLogger(self._output, levels, log_sink)
+        if self._profiler:
+            self._profiler.instrument(self._logger, ["handle"], "logging: ")
+
+        # Lower the root logger level only as far as needed for the records
+        # to reach the handler, and restore it at the end of the session
+        root = logging.getLogger()
+        self._root_log_level = root.level
+        if levels.minimum < root.getEffectiveLevel():
+            root.setLevel(levels.minimum)
+        self._session_log_level = root.level
+        root.addHandler(self._logger)
+
+        if self.config.getoption("autotrace_subprocesses"):
+            self._subprocesses = SubprocessTracing(self._output, {
+                "libpaths": tracerobot_config["autotrace_libpaths"] or [],
+                "silentpaths": list(
+                    tracerobot_config["autotrace_silentpaths"]),
+                "privates": tracerobot_config["autotrace_privates"],
+                "rootpath": os.getcwd(),
+                "log_level": get_option(self.config, "robot_log_level"),
+                "log_filters": get_option(self.config, "robot_log_filters"),
+            }, on_fork=self._detach_forked_process)
+            self._subprocesses.open()
+
+    def _detach_forked_process(self):
+        """ Stop the tracing of pytest in a process forked by a test. """
+        self._tracer.abandon()
+        logging.getLogger().removeHandler(self._logger)
+
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        while self._stack:
+            if len(self._stack) == 1 and self._profiler:
+                self._end_suite(self._profiler.metadata())
+            else:
+                self._end_suite()
+
+        logging.getLogger().removeHandler(self._logger)
+        logging.getLogger().setLevel(self._root_log_level)
+        if self._subprocesses:
+            self._subprocesses.close()
+        self._tracer.close()
+        self._output.close()
+        if self._journal_path:
+            convert_journal(self._journal_path, self._output_path)
+        if self._history:
+            self._history.close()
+
+        if xdist_worker_id(self.config) is not None:
+            if not self._split_dir:
+                self.config.workeroutput["tracerobot_output"] = \
+                    self._output_path
+                self.config.workeroutput["tracerobot_nodeids"] = \
+                    self._nodeids
+        else:
+            self._rebot, self._rebot_status = start_session_rebot(
+                self.config, self._output_path, self._split_dir)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        report_rebot(terminalreporter, self._rebot, self._rebot_status)
+        if self._profiler:
+            terminalreporter.write_sep("-", "tracerobot profile")
+            for label, calls, seconds in self._profiler.report():
+                terminalreporter.write_line("%-45s %10d calls %10.3f s" % (
+                    label, calls, seconds))
+
+        if self._tracer is None or terminalreporter.verbosity < 1:
+            return
+        filters = self._tracer.filters
+        terminalreporter.write_line(
+            "tracerobot: autotrace decision cache: %d hits, %d misses" % (
+                sum(trace_filter.hits for trace_filter in filters),
+                sum(trace_filter.misses for trace_filter in filters)))
+
+    def pytest_collection_modifyitems(self, session, config, items):
+        # Invalid tracing settings are reported before any test runs
+        for item in items:
+            try:
+                check_log_level(
+                    settings_for(item, self._defaults, self._trace_rules))
+            except ValueError as err:
+                raise pytest.UsageError("%s: %s" % (item.nodeid, err))
+
+        if self._history is None or \
+                config.getoption("robot_order") != "longest-first":
+            return
+        # Tests without history first, as they may be slow too
+        durations = self._history.baselines()
+        items.sort(key=lambda item: -durations.get(item.nodeid, float("inf")))
+
+    def pytest_collection_finish(self, session):
+        # Under pytest-xdist, session.items is not the order in which the
+        # worker runs its tests; the controller merges the suites instead.
+        if xdist_worker_id(self.config) is not None:
+            return
+        paths = [item.location[0].split(os.sep) for item in session.items]
+        if is_contiguous(paths) or self._journal_path:
+            # the journal is converted with each suite written once
+            return
+        self._require_timestamps("Running the tests of a file apart from "
+                                 "each other, e.g. reordered by a plugin,")
+        self._suite_merger.spool()
+
+    # Test running hooks
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        """Each directory and test file maps to a Robot Framework suite.
+        Because pytest doesn't seem to provide hook for entering/leaving
+        suites as such, the current suite must be determined before each test.
+        """
+        #filename, linenum, testname = location
+        filename, _, _ = location
+        self._setup_fixtures.clear()
+
+        target = filename.split(os.sep)
+        common = common_items(self.current_path, target)
+
+        while len(self.current_path) > len(common):
+            self._end_suite()
+
+        assert self.current_path == common
+
+        while len(self.current_path) < len(target):
+            name = target[len(self.current_path)]
+            self._start_suite(name)
+
+        assert self.current_path == target
+
+
+    @contextmanager
+    def autotracer_running(self, kwtype="kw"):
+        if not self._settings.autotrace:
+            yield
+            return
+        was_running = self._tracer.running
+        self._tracer.start()
+        self._tracer.set_kwtype(kwtype)
+        yield
+        if not was_running:
+            self._tracer.stop()
+
+    def _fixture_keyword(self, fixturedef, phase, cached=False):
+        """ Start the keyword of a fixture setup or teardown. Outside of
+            tests, it is a setup or teardown keyword of the suite. A setup
+            is a cache hit if the cached value of the fixture is used. """
+        kwtype = "kw" if self._tests else phase
+        args = ["scope=%s" % fixturedef.scope]
+        if phase == "setup":
+            args.append("cache=hit" if cached else "cache=miss")
+        return KeywordCtx(self._output, fixturedef.argname, kwtype, args)
+
+    def _start_fixture_teardown(self, fixturedef):
+        was_running = self._tracer.running
+        self._fixture_teardowns[fixturedef] = (
+            self._fixture_keyword(fixturedef, "teardown"), was_running)
+        if self._settings.autotrace:
+            self._tracer.start()
+
+    # Reporting hooks
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+
+        if is_direct_param(fixturedef):
+            # an argument of @pytest.mark.parametrize, not a fixture
+            yield
+            return
+
+        scope = fixturedef.scope    # 'function', 'class', 'module', 'session'
+
+        if HOOK_DEBUG:
+            # Note: run pytest with -s to see these
+            print("\npytest_fixture_setup", fixturedef, request, request.node)
+
+        if scope == 'function':
+            # Function-scope fixtures typically mark start of a new test case
+            # (except when there are multiple fixtures)
+            item = request.node
+
+            if not self._is_test_started(item):
+                self._start_test_envelope(
+                    item, with_setup_and_teardown=True)
+                self._start_test_setup(item)
+
+        # Broader scope fixtures may get run at any point of the test
+        # execution. Outside of tests, they are logged as suite keywords.
+        # The fixture function itself is written as the fixture keyword.
+        code = getattr(fixturedef.func, "__code__", None)
+        if code is not None:
+            self._tracer.hide(code)
+        self._setup_fixtures[fixturedef.argname] = False
+
+        start = time.perf_counter()
+        with self.autotracer_running(), \
+                self._fixture_keyword(fixturedef, "setup") as fixture_kw:
+            outcome = yield
+            if outcome.excinfo:
+                fixture_kw.set_error_msg(format_error(outcome.excinfo[1]))
+                self._setup_fixtures[fixturedef.argname] = True
+
+        if self._history:
+            self._history.record(
+                "%s::%s" % (fixturedef.baseid, fixturedef.argname),
+                time.perf_counter() - start, kind="fixture")
+        if outcome.excinfo:
+            return
+
+        # Each fixture teardown gets its own keyword: it is started by a
+        # finalizer added last, which pytest calls first, and ends in
+        # pytest_fixture_post_finalizer. Errors of the teardown are
+        # reported by the teardown phase of the test.
+        request.addfinalizer(
+            functools.partial(self._start_fixture_teardown, fixturedef))
+
+    def pytest_fixture_post_finalizer(self, fixturedef, request):
+        teardown = self._fixture_teardowns.pop(fixturedef, None)
+        if teardown is None:
+            return
+        fixture_kw, was_running = teardown
+        fixture_kw.__exit__(None, None, None)
+        if not was_running:
+            self._tracer.stop()
+
+
+    def pytest_runtest_call(self, item):
+        pass
+
+    def pytest_runtest_makereport(self, item, call):
+
+        #call.when: (post)"setup", (post)"call", (post)"teardown"
+        #note: setup and teardown are called even if a test has no fixture
+
+        if HOOK_DEBUG:
+            print("\npytest_runtest_makereport", item, call)
+
+        # aggregated asserts go to the phase that just ended
+        self._asserts.flush()
+
+        if call.when == "setup":
+            #  finish setup phase (if any), start test body
+
+            if self._is_test_with_setup_and_teardown(item):
+                self._finish_test_setup(item, call)
+                if not call.excinfo:
+                    self._start_test_body(item)
+                else:
+                    self._finish_test_envelope(item, call)
+            else:
+                self._start_test_envelope(item)
+                self._write_cached_fixtures(item)
+                if call.excinfo:
+                    self._finish_test_envelope(item, call)
+
+        # pytest_runtest_call(item) gets called between "setup" and "call"
+
+        elif call.when == "call":
+            # test body called, enter teardown phase
+            if self._is_test_with_setup_and_teardown(item):
+                self._finish_test_body(item, call)
+                self._start_test_teardown(item)
+            else:
+                self._finish_test_envelope(item, call)
+
+        elif call.when == "teardown":
+            # teardown finished
+            if self._is_test_with_setup_and_teardown(item):
+                self._finish_test_teardown(item, call)
+                self._finish_test_envelope(item, call)
+
+
+    def pytest_assertion_pass(self, item, lineno, orig, expl):
+
+        if HOOK_DEBUG:
+            print("\npytest_assertion_pass", item.fspath, lineno, orig)
+
+        self._asserts.passed(item.location[0], lineno, orig, expl)
+
+
+class TraceRobotXdistController:
+    """ Plugin for the pytest-xdist controller process. The controller does
+        not run tests itself, it only merges the outputs of the workers. """
+
+    def __init__(self, config):
+        self.config = config
+        self._shards = []
+        self._nodeids = None
+        self._rebot = self._rebot_status = None
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_xdist_node_collection_finished(self, node, ids):
+        if self._nodeids is None:
+            self._nodeids = list(ids)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        workeroutput = getattr(node, "workeroutput", None) or {}
+        shard = workeroutput.get("tracerobot_output")
+        if shard and os.path.exists(shard):
+            self._shards.append(
+                (shard, workeroutput.get("tracerobot_nodeids")))
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        split_dir = self.config.getoption("robot_split")
+        if self._shards:
+            shards = sorted(self._shards, key=lambda shard: shard[0])
+            paths = [path for path, _ in shards]
+            order = nodeid_order(self._nodeids) if self._nodeids else None
+            merge_outputs(paths, self.config.getoption("robot_output"), order,
+                          [nodeids for _, nodeids in shards])
+            for path in paths:
+                os.remove(path)
+        elif not split_dir:
+            return
+        self._rebot, self._rebot_status = start_session_rebot(
+            self.config, self.config.getoption("robot_output"), split_dir)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        report_rebot(terminalreporter, self._rebot, self._rebot_status)
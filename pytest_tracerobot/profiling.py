@@ -0,0 +1,88 @@
+""" Self-profiling of the plugin.
+
+With --tracerobot-profile, the hooks of the plugin, the autotracer
+callbacks, the logging handler and the methods of the output writer are
+replaced with wrappers that count their calls and measure their cumulative
+time. Times are inclusive: a hook that writes to the output includes the
+time spent in the output writer.
+"""
+
+import functools
+import inspect
+import time
+
+# Methods of each output writer that are profiled
+OUTPUT_METHODS = ("start_suite", "end_suite", "start_test", "end_test",
+                  "start_keyword", "end_keyword", "log_message", "close")
+
+
+class PluginProfiler:
+    """ Call counts and cumulative times of instrumented callables. """
+
+    def __init__(self):
+        # label -> [calls, seconds]
+        self.stats = {}
+
+    def _add(self, label, elapsed, calls=1):
+        stat = self.stats.get(label)
+        if stat is None:
+            stat = self.stats[label] = [0, 0.0]
+        stat[0] += calls
+        stat[1] += elapsed
+
+    def wrap(self, func, label):
+        """ Return a timed wrapper of func. Generator functions, such as
+            pytest hook wrappers, are timed without the time they spend
+            suspended. """
+        clock = time.perf_counter
+        add = self._add
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def timed_generator(*args, **kwargs):
+                start = clock()
+                gen = func(*args, **kwargs)
+                try:
+                    value = next(gen)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    add(label, clock() - start)
+                while True:
+                    sent = yield value
+                    start = clock()
+                    try:
+                        value = gen.send(sent)
+                    except StopIteration as stop:
+                        return stop.value
+                    finally:
+                        add(label, clock() - start, calls=0)
+            return timed_generator
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(label, clock() - start)
+        return timed
+
+    def instrument(self, obj, names, prefix):
+        """ Replace the methods names of obj with timed wrappers. """
+        for name in names:
+            method = getattr(obj, name, None)
+            if callable(method):
+                setattr(obj, name, self.wrap(method, prefix + name))
+
+    def report(self):
+        """ Return (label, calls, seconds) tuples, slowest first. """
+        return sorted(((label, calls, seconds)
+                       for label, (calls, seconds) in self.stats.items()),
+                      key=lambda stat: stat[2], reverse=True)
+
+    def metadata(self):
+        """ Profile as suite metadata. """
+        return {"tracerobot profile: " + label:
+                "%d calls, %.3f s" % (calls, seconds)
+                for label, calls, seconds in self.report()}
@@ -0,0 +1,133 @@
+""" HTML log and report generation after the session.
+
+With --robot-rebot, the plugin runs Robot Framework's rebot on its output
+at the end of the session, in a separate process so that pytest does not
+have to wait for it. With split output (--robot-split), each part gets its
+own log and report, and the parts are processed in parallel, up to
+--robot-rebot-jobs at a time. A single output.xml is processed by one
+rebot, as rebot can not split the parsing of one file.
+
+The helper process writes a status file when it is done:
+
+    {"done": true, "artifacts": ["log.html", "report.html"], "errors": []}
+
+where errors lists the outputs that rebot failed on, with its error output.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+STATUS_NAME = "rebot-status.json"
+
+# Runs main() in a helper process
+_HELPER = "from pytest_tracerobot.rebot import main; main()"
+
+
+def artifact_paths(output):
+    """ Return the (log, report) paths of an output XML file. """
+    directory, name = os.path.split(output)
+    base = os.path.splitext(name)[0]
+    if base == "output":
+        return (os.path.join(directory, "log.html"),
+                os.path.join(directory, "report.html"))
+    return (os.path.join(directory, base + "-log.html"),
+            os.path.join(directory, base + "-report.html"))
+
+
+def _write_status(path, status):
+    with open(path + ".tmp", "w", encoding="UTF-8") as status_file:
+        json.dump(status, status_file, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _rebot(output):
+    log, report = artifact_paths(output)
+    result = subprocess.run(
+        [sys.executable, "-m", "robot.rebot", "--nostatusrc",
+         "--log", log, "--report", report, output],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    return result.returncode, result.stderr, [log, report]
+
+
+def run_rebots(outputs, status_path, jobs=None):
+    """ Run rebot on each of outputs, jobs at a time, and write the status
+        file. """
+    artifacts = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        for output, (returncode, stderr, paths) in zip(
+                outputs, pool.map(_rebot, outputs)):
+            if returncode == 0:
+                artifacts.extend(paths)
+            else:
+                errors.append({"output": output, "error": stderr.strip()})
+    _write_status(status_path, {
+        "done": True, "artifacts": artifacts, "errors": errors})
+
+
+class RebotJob:
+    """ rebot helper process started by the plugin. """
+
+    def __init__(self, outputs, status_path, jobs=None):
+        self.outputs = list(outputs)
+        self.status_path = status_path
+        self._jobs = jobs
+        self._process = None
+
+    @staticmethod
+    def available():
+        return find_spec("robot") is not None
+
+    def start(self, background=True):
+        """ Start the helper process. In the background, it is detached from
+            pytest, so that it keeps running after pytest exits. """
+        _write_status(self.status_path, {"done": False})
+        args = [sys.executable, "-c", _HELPER, "--status", self.status_path]
+        if self._jobs:
+            args += ["--jobs", str(self._jobs)]
+        log_path = os.path.splitext(self.status_path)[0] + ".log"
+        with open(log_path, "w") as log:
+            self._process = subprocess.Popen(
+                args + self.outputs, stdin=subprocess.DEVNULL, stdout=log,
+                stderr=subprocess.STDOUT, start_new_session=background)
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def wait(self):
+        """ Wait for the helper to finish and return its status. """
+        self._process.wait()
+        try:
+            with open(self.status_path, encoding="UTF-8") as status_file:
+                return json.load(status_file)
+        except (OSError, ValueError):
+            return {"done": False}
+
+
+def start_rebot(outputs, status_path, jobs=None, background=True):
+    """ Start a RebotJob, or return None with a warning if Robot Framework
+        is not installed. """
+    job = RebotJob(outputs, status_path, jobs)
+    if not job.available():
+        warnings.warn("--robot-rebot requires Robot Framework "
+                      "(pip install robotframework)")
+        return None
+    job.start(background)
+    return job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="tracerobot-rebot")
+    parser.add_argument("--status", required=True)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("outputs", nargs="+")
+    args = parser.parse_args(argv)
+    run_rebots(args.outputs, args.status, args.jobs)
@@ -0,0 +1,89 @@
+""" Trace retention: keep the keyword trace of failed tests only.
+
+Keywords and log messages of the running test are held in a bounded ring
+buffer. When the test ends with an error, the buffer is written out before
+the end of the test; for a passing test it is dropped, leaving only the test
+itself with its status in the output. If the buffer overflows, the oldest
+events are dropped and a note about the dropped events is written in their
+place.
+"""
+
+import time
+from collections import deque
+
+
+class RetainFailedOutput:
+    """ Output wrapper that passes on the keywords and messages of a test to
+        output only if the test fails. """
+
+    def __init__(self, output, max_events=100000):
+        self._output = output
+        self._buffer = None
+        self._max_events = max_events
+        self._received = 0
+
+    def open(self):
+        self._output.open()
+
+    def close(self):
+        self._output.close()
+
+    def _record(self, method, args, timestamp):
+        if self._buffer is None:
+            return False
+        self._buffer.append((method, args, timestamp or time.time()))
+        self._received += 1
+        return True
+
+    def _write_buffer(self):
+        dropped = self._received - len(self._buffer)
+        events = self._buffer
+        self._buffer = None
+
+        if dropped:
+            self._output.log_message(
+                "%d earlier keyword and message events were dropped from "
+                "the trace buffer" % dropped, "WARN",
+                timestamp=events[0][2])
+
+        depth = 0
+        for method, args, timestamp in events:
+            if method == "start_keyword":
+                depth += 1
+            elif method == "end_keyword":
+                if depth == 0:
+                    # keyword started before the dropped events
+                    continue
+                depth -= 1
+            getattr(self._output, method)(*args, timestamp=timestamp)
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        self._output.start_suite(name, timestamp=timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._output.end_suite(metadata, timestamp=timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._output.start_test(name, doc, tags, timestamp=timestamp)
+        self._buffer = deque(maxlen=self._max_events)
+        self._received = 0
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        if error_msg and self._buffer:
+            self._write_buffer()
+        self._buffer = None
+        self._output.end_test(error_msg, tags, timestamp=timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        if not self._record("start_keyword", (name, kwtype, args), timestamp):
+            self._output.start_keyword(name, kwtype, args, timestamp=timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        if not self._record("end_keyword", (error_msg,), timestamp):
+            self._output.end_keyword(error_msg, timestamp=timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        if not self._record("log_message", (msg, level), timestamp):
+            self._output.log_message(msg, level, timestamp=timestamp)
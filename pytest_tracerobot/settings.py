@@ -0,0 +1,133 @@
+""" Per-test tracing settings.
+
+The tracing of a test can be controlled with the tracerobot marker, e.g.
+
+    @pytest.mark.tracerobot(autotrace=False)
+    @pytest.mark.tracerobot(depth=3, libpaths=["/opt/lib"], log_level="INFO")
+
+on the test function, its class or its module (pytestmark), and with
+robot_trace ini lines of a node id pattern and options:
+
+    robot_trace =
+        tests/load/* autotrace=false
+        tests/functional/test_api.py::* depth=10 log_level=DEBUG
+
+Each option is taken from the closest marker that sets it, then from the
+last matching ini line that sets it, and then from the session defaults.
+Invalid options raise ValueError, which the plugin reports as a usage error
+before the tests run.
+"""
+
+import fnmatch
+
+MARKER = "tracerobot"
+MARKER_HELP = (MARKER + "(autotrace=True, depth=None, libpaths=(), "
+               "log_level=None): tracing of the test by pytest-tracerobot")
+
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off")
+
+
+def _parse_bool(value):
+    if value.lower() in _TRUE:
+        return True
+    if value.lower() in _FALSE:
+        return False
+    raise ValueError("Invalid boolean value: %s" % value)
+
+
+def _parse_depth(value):
+    return None if value.lower() == "none" else int(value)
+
+
+def _parse_libpaths(value):
+    return tuple(path for path in value.split(",") if path)
+
+
+# option name -> parser of its ini value
+_INI_PARSERS = {
+    "autotrace": _parse_bool,
+    "depth": _parse_depth,
+    "libpaths": _parse_libpaths,
+    "log_level": str,
+}
+
+
+class TraceSettings:
+    """ Tracing settings of a test.
+
+        autotrace: whether keywords are traced automatically.
+        depth: keywords nested deeper than this are not written (None for
+        no limit).
+        libpaths: paths traced in addition to the session libpaths.
+        log_level: lowest level of log records written (None for the
+        session level).
+    """
+
+    __slots__ = ("autotrace", "depth", "libpaths", "log_level")
+
+    def __init__(self, autotrace=True, depth=None, libpaths=(),
+                 log_level=None):
+        self.autotrace = autotrace
+        self.depth = depth
+        self.libpaths = tuple(libpaths)
+        self.log_level = log_level
+
+    def updated(self, options):
+        """ Return a copy with options (a dict) applied. libpaths can be
+            given as a list or as a comma separated string. """
+        unknown = set(options) - set(self.__slots__)
+        if unknown:
+            raise ValueError("Unknown %s marker option(s): %s" % (
+                MARKER, ", ".join(sorted(unknown))))
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(options)
+        if isinstance(values["libpaths"], str):
+            values["libpaths"] = _parse_libpaths(values["libpaths"])
+        if not isinstance(values["autotrace"], bool):
+            raise ValueError("Invalid %s option autotrace=%r (expected True "
+                             "or False)" % (MARKER, values["autotrace"]))
+        depth = values["depth"]
+        if depth is not None and (isinstance(depth, bool) or
+                                  not isinstance(depth, int)):
+            raise ValueError("Invalid %s option depth=%r (expected an "
+                             "integer or None)" % (MARKER, depth))
+        return TraceSettings(**values)
+
+
+def parse_ini_lines(lines):
+    """ Parse robot_trace ini lines into (pattern, options) tuples. """
+    rules = []
+    for line in lines:
+        pattern, *specs = line.split()
+        options = {}
+        for spec in specs:
+            name, sep, value = spec.partition("=")
+            if not sep or name not in _INI_PARSERS:
+                raise ValueError("Invalid robot_trace option: %s" % spec)
+            options[name] = _INI_PARSERS[name](value)
+        rules.append((pattern, options))
+    return rules
+
+
+def get_option(config, name):
+    """ Return the command line option name, or the ini value of the same
+        name if the option was not given. """
+    value = config.getoption(name)
+    if value is None:
+        value = config.getini(name)
+    return value
+
+
+def settings_for(item, defaults, rules):
+    """ Return the TraceSettings of item. """
+    options = {}
+    for pattern, rule in rules:
+        if fnmatch.fnmatch(item.nodeid, pattern):
+            options.update(rule)
+    # iter_markers() returns the closest marker first
+    for marker in reversed(list(item.iter_markers(MARKER))):
+        options.update(marker.kwargs)
+    if not options:
+        return defaults
+    return defaults.updated(options)
@@ -0,0 +1,240 @@
+""" Split output.
+
+With --robot-split, the output is written as several Robot Framework XML
+files (parts) into a directory instead of one output.xml. A new part is
+started whenever a suite at the split depth (1: the top-level suites)
+begins, and when the current part has grown beyond a size limit. The suites
+that are open when a part ends are ended in it and started again in the
+next part, so each part is a complete output of its own, which can be
+processed with rebot independently and in parallel.
+
+The directory also gets an index.json, rewritten after each part:
+
+    {"generator": "pytest-tracerobot", "parts": [
+        {"path": "001-tests-api.xml", "suites": [["tests", "api"]],
+         "tests": 12, "passed": 11, "failed": 1, "bytes": 48213,
+         "starttime": "20200131 13:45:01.123",
+         "endtime": "20200131 13:45:09.456"}]}
+
+where suites lists the suite paths, cut at the split depth, of the tests in
+the part. The tracerobot-merge command combines the parts of one or more
+indexes, or only those of given suites, into a single output:
+
+    tracerobot-merge out/ -o output.xml --suite tests/api
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+from .merge import merge_outputs
+from .output import RobotXmlWriter, format_timestamp
+
+INDEX_NAME = "index.json"
+
+
+def _part_name(number, suites):
+    names = [re.sub(r"[^\w.-]+", "_", name) for name in suites]
+    return "-".join(["%03d" % number] + names) + ".xml"
+
+
+class SplitOutput:
+    """ Output that writes suites into separate RobotXmlWriter parts.
+
+        depth: nesting depth of the suites that start a new part.
+        max_bytes: size after which a new part is started at the next
+        test, or None for no limit.
+    """
+
+    def __init__(self, directory, depth=1, max_bytes=None):
+        self._directory = directory
+        self._depth = depth
+        self._max_bytes = max_bytes
+        self._writer = None
+        # index entry of the current part
+        self._part = None
+        self._parts = []
+        # names of the open suites, and the number of open tests and
+        # keywords within them
+        self._suites = []
+        self._nested = 0
+        # keywords started before the first part, which are not written
+        self._dropped = 0
+
+    def open(self):
+        os.makedirs(self._directory, exist_ok=True)
+
+    def close(self):
+        if self._writer is not None:
+            self._close_part()
+
+    def _open_part(self, timestamp, suites):
+        self._part = {
+            "path": _part_name(len(self._parts) + 1, suites[:self._depth]),
+            "suites": [],
+            "starttime": format_timestamp(timestamp or time.time()),
+        }
+        self._writer = RobotXmlWriter(
+            os.path.join(self._directory, self._part["path"]))
+        self._writer.open()
+        for name in self._suites:
+            self._writer.start_suite(name, timestamp=timestamp)
+
+    def _close_part(self, timestamp=None):
+        writer = self._writer
+        for _ in self._suites:
+            writer.end_suite(timestamp=timestamp)
+        self._part.update(
+            tests=writer.passed + writer.failed,
+            passed=writer.passed,
+            failed=writer.failed,
+            endtime=format_timestamp(timestamp or time.time()))
+        writer.close()
+        self._part["bytes"] = os.path.getsize(
+            os.path.join(self._directory, self._part["path"]))
+        self._writer = None
+        self._parts.append(self._part)
+        self._write_index()
+
+    def _write_index(self):
+        path = os.path.join(self._directory, INDEX_NAME)
+        with open(path + ".tmp", "w", encoding="UTF-8") as index:
+            json.dump({"generator": RobotXmlWriter.GENERATOR,
+                       "parts": self._parts}, index, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def _split(self, timestamp, suites, new_suite=False):
+        """ Start a new part for suites if the current one has tests, and
+            either a suite at the split depth starts or the size limit is
+            exceeded. Only suites may be open. """
+        writer = self._writer
+        if writer is not None:
+            if writer.passed + writer.failed == 0:
+                return
+            if not (new_suite or (self._max_bytes is not None and
+                                  writer.size >= self._max_bytes)):
+                return
+            self._close_part(timestamp)
+        self._open_part(timestamp, suites)
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        if self._writer is None or (not self._nested and
+                                    len(self._suites) < self._depth):
+            self._split(timestamp, self._suites + [name], new_suite=True)
+        self._suites.append(name)
+        self._writer.start_suite(name, timestamp=timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._suites.pop()
+        self._writer.end_suite(metadata, timestamp=timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        if self._max_bytes is not None and not self._nested:
+            self._split(timestamp, self._suites)
+        suites = self._suites[:self._depth]
+        if suites not in self._part["suites"]:
+            self._part["suites"].append(suites)
+        self._nested += 1
+        self._writer.start_test(name, doc, tags, timestamp=timestamp)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._nested -= 1
+        self._writer.end_test(error_msg, tags, timestamp=timestamp)
+
+    # Like RobotXmlWriter, keywords and messages outside of any suite (e.g.
+    # logged while test modules are imported) are not written
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        if self._writer is None or self._dropped:
+            self._dropped += 1
+            return
+        self._nested += 1
+        self._writer.start_keyword(name, kwtype, args, timestamp=timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        if self._dropped:
+            self._dropped -= 1
+            return
+        self._nested -= 1
+        self._writer.end_keyword(error_msg, timestamp=timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        if self._writer is None or self._dropped:
+            return
+        self._writer.log_message(msg, level, timestamp=timestamp)
+
+
+def read_index(path):
+    """ Return the parts of the index at path (a file or a directory), with
+        their paths made relative to the current directory. """
+    if os.path.isdir(path):
+        path = os.path.join(path, INDEX_NAME)
+    with open(path, encoding="UTF-8") as index:
+        parts = json.load(index)["parts"]
+    directory = os.path.dirname(path)
+    for part in parts:
+        part["path"] = os.path.join(directory, part["path"])
+    return parts
+
+
+def find_parts(directory):
+    """ Return the paths of the parts of the split output in directory and
+        in its immediate subdirectories (used by pytest-xdist workers). The
+        directory may not exist, e.g. if no test was run. """
+    if not os.path.isdir(directory):
+        return []
+    paths = []
+    for path in [directory] + sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)):
+        if os.path.isfile(os.path.join(path, INDEX_NAME)):
+            paths.extend(part["path"] for part in read_index(path))
+    return paths
+
+
+def _in_suites(part, suites):
+    for wanted in suites:
+        for path in part["suites"]:
+            if path[:len(wanted)] == wanted[:len(path)]:
+                return True
+    return False
+
+
+def merge_parts(indexes, output_path, suites=None):
+    """ Merge the parts of indexes into output_path. suites optionally
+        limits the parts to those with tests in the given suite paths
+        (lists of names). Returns the number of parts merged. """
+    paths = []
+    for index in indexes:
+        for part in read_index(index):
+            if not suites or _in_suites(part, suites):
+                paths.append(part["path"])
+    if paths:
+        merge_outputs(paths, output_path)
+    return len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="tracerobot-merge",
+        description="Merge the parts of a pytest-tracerobot split output "
+                    "(--robot-split) into one Robot Framework output XML.")
+    parser.add_argument("indexes", nargs="+", metavar="index",
+                        help="index.json file, or a directory that has one")
+    parser.add_argument("-o", "--output", default="output.xml",
+                        help="output XML file (default: output.xml)")
+    parser.add_argument("--suite", action="append", default=[],
+                        help="only merge the parts of this suite path, e.g. "
+                             "tests/api; can be given multiple times")
+    args = parser.parse_args(argv)
+    suites = [[name for name in suite.split("/") if name]
+              for suite in args.suite]
+    if not merge_parts(args.indexes, args.output, suites):
+        parser.exit(1, "tracerobot-merge: no parts to merge\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+""" Tracing of child processes.
+
+With --autotrace-subprocesses, the Python processes started during a test
+trace themselves: multiprocessing and concurrent.futures workers as well as
+Python programs run with subprocess. Each child writes its keywords and log
+messages into an event journal (see journal.py) of its own, a side file in
+a temporary directory of the test. At the end of the test, the journals are
+written into the test, each in a "Process <pid>" keyword with the command
+line of the process as argument and the original timestamps.
+
+Processes started with exec find the tracer through a sitecustomize module
+that is put on PYTHONPATH during the test. It runs the sitecustomize module
+that it hides, if there is one. Forked processes, e.g. multiprocessing
+workers on Linux, stop the tracing of pytest and start their own. Only the
+children whose Python can import pytest_tracerobot are traced. The journal
+of a child is flushed after each of its outermost keywords; what a killed
+child had not flushed is lost.
+
+The side files of a test are removed at its end. A process that outlives
+the test that started it, e.g. a pool worker that is reused by later tests,
+is written only up to the end of that test: it goes on writing into its
+removed side file (open files can be removed on POSIX systems), and its
+later events are not written anywhere.
+"""
+
+import atexit
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from .journal import JournalWriter, read_journal
+from .logbridge import LoggerLevels, TraceRobotPythonLogger
+from .tracer import AutoTracer
+
+# Tracing configuration of the child processes, as JSON
+ENV_CONFIG = "TRACEROBOT_SUBPROCESS"
+
+INCOMPLETE = "Process had not finished its trace at the end of the test"
+
+_SITECUSTOMIZE = '''\
+""" Starts pytest-tracerobot in the processes started during a test. """
+import os
+import sys
+
+_this = sys.modules["sitecustomize"]
+_site = os.path.dirname(os.path.abspath(__file__))
+if _site in sys.path:
+    sys.path.remove(_site)
+del sys.modules["sitecustomize"]
+try:
+    import sitecustomize
+except ImportError:
+    pass
+sys.modules["sitecustomize"] = _this
+
+try:
+    from pytest_tracerobot.subprocesses import start_child
+except ImportError:
+    pass
+else:
+    start_child(" ".join(getattr(sys, "orig_argv", sys.argv)))
+'''
+
+# SubprocessTracing of the pytest process, and _Child of a traced child
+_parent = None
+_child = None
+_fork_hooks = False
+
+
+class _ChildJournal(JournalWriter):
+    """ Journal of a child process, flushed after each outermost keyword
+        within the process keyword. """
+
+    def __init__(self, path):
+        super(_ChildJournal, self).__init__(path)
+        self._depth = 0
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._depth += 1
+        super(_ChildJournal, self).start_keyword(name, kwtype, args,
+                                                 timestamp=timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        super(_ChildJournal, self).end_keyword(error_msg, timestamp=timestamp)
+        self._depth -= 1
+        if self._depth <= 1:
+            self.flush()
+
+
+class _Child:
+    """ Tracing of a child process. """
+
+    def __init__(self, config, label):
+        self._output = _ChildJournal(os.path.join(
+            config["directory"], "%d.jsonl" % os.getpid()))
+        self._output.open()
+        self._output.start_keyword("Process %d" % os.getpid(), args=[label])
+        self._tracer = AutoTracer(
+            self._output,
+            libpaths=config["libpaths"],
+            silentpaths=config["silentpaths"],
+            privates=config["privates"],
+            rootpath=config["rootpath"])
+        levels = LoggerLevels(config["log_level"], config["log_filters"])
+        self._logger = TraceRobotPythonLogger(self._output, levels)
+        root = logging.getLogger()
+        if levels.minimum < root.getEffectiveLevel():
+            root.setLevel(levels.minimum)
+        root.addHandler(self._logger)
+        self._tracer.start()
+
+    def flush(self):
+        if self._output is not None:
+            self._output.flush()
+
+    def stop(self):
+        if self._output is None:
+            return
+        self._tracer.stop()
+        logging.getLogger().removeHandler(self._logger)
+        self._output.end_keyword()
+        self._output.close()
+        self._output = None
+
+    def abandon(self):
+        """ Stop tracing in a forked process, leaving the journal to the
+            parent. It has been flushed before the fork. """
+        self._tracer.abandon()
+        logging.getLogger().removeHandler(self._logger)
+        self._output = None
+
+    def stop_with_process(self):
+        """ Stop when a multiprocessing process ends. Forked processes exit
+            without running atexit callbacks. """
+        from multiprocessing.util import Finalize
+        Finalize(None, self.stop, exitpriority=0)
+
+
+def start_child(label):
+    """ Start tracing this process, if it was started during a traced test.
+    """
+    global _child
+    config = os.environ.get(ENV_CONFIG)
+    if config is None or _child is not None:
+        return
+    _child = _Child(json.loads(config), label)
+    atexit.register(_child.stop)
+    _register_fork_hooks()
+
+
+def _before_fork():
+    if _child is not None:
+        _child.flush()
+
+
+def _after_fork():
+    global _parent, _child
+    if _parent is not None:
+        parent, _parent = _parent, None
+        parent.forked()
+    elif _child is not None:
+        _child.abandon()
+        _child = None
+    else:
+        return
+    start_child("forked from %d" % os.getppid())
+    if _child is not None and "multiprocessing.util" in sys.modules:
+        # run by multiprocessing after its own fork handling
+        sys.modules["multiprocessing.util"].register_after_fork(
+            _child, _Child.stop_with_process)
+
+
+def _register_fork_hooks():
+    global _fork_hooks
+    if _fork_hooks or not hasattr(os, "register_at_fork"):
+        return
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork)
+    _fork_hooks = True
+
+
+class SubprocessTracing:
+    """ Traces the Python processes started during tests, see above.
+
+        config: dict of the tracer and logging settings of the children.
+        on_fork: called in a forked child to stop the tracing of pytest.
+    """
+
+    def __init__(self, output, config, on_fork=None):
+        self._output = output
+        self._config = config
+        self._on_fork = on_fork
+        self._directory = None
+        self._site = None
+        self._tests = 0
+        self._test_dir = None
+        # values of the environment variables before the test
+        self._saved_env = {}
+
+    def open(self):
+        global _parent
+        self._directory = tempfile.mkdtemp(prefix="tracerobot-")
+        self._site = os.path.join(self._directory, "site")
+        os.mkdir(self._site)
+        with open(os.path.join(self._site, "sitecustomize.py"), "w") as module:
+            module.write(_SITECUSTOMIZE)
+        _parent = self
+        _register_fork_hooks()
+
+    def close(self):
+        global _parent
+        _parent = None
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def forked(self):
+        if self._on_fork is not None:
+            self._on_fork()
+
+    def _set_env(self, name, value):
+        self._saved_env[name] = os.environ.get(name)
+        os.environ[name] = value
+
+    def start_test(self):
+        self._tests += 1
+        self._test_dir = os.path.join(self._directory, str(self._tests))
+        os.mkdir(self._test_dir)
+        self._set_env(ENV_CONFIG, json.dumps(
+            dict(self._config, directory=self._test_dir)))
+        pythonpath = os.environ.get("PYTHONPATH")
+        self._set_env("PYTHONPATH", self._site + (
+            os.pathsep + pythonpath if pythonpath else ""))
+
+    def end_test(self):
+        """ Write the journals of the children of the test. """
+        for name, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self._saved_env.clear()
+
+        journals = []
+        for name in os.listdir(self._test_dir):
+            if name.endswith(".jsonl"):
+                events = list(read_journal(os.path.join(self._test_dir, name)))
+                if events:
+                    journals.append(events)
+        for events in sorted(journals, key=lambda events: events[0][2]):
+            self._write_journal(events)
+        shutil.rmtree(self._test_dir, ignore_errors=True)
+        self._test_dir = None
+
+    def _write_journal(self, events):
+        output = self._output
+        depth = 0
+        for method, args, timestamp in events:
+            if method == "start_keyword":
+                depth += 1
+            elif method == "end_keyword":
+                if depth == 0:
+                    continue
+                depth -= 1
+            elif method != "log_message":
+                continue
+            getattr(output, method)(*args, timestamp=timestamp)
+        if depth:
+            timestamp = events[-1][2] or time.time()
+            output.log_message(INCOMPLETE, "WARN", timestamp=timestamp)
+            for _ in range(depth):
+                output.end_keyword(timestamp=timestamp)
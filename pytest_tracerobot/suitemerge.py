@@ -0,0 +1,134 @@
+""" Merging of suites that are entered more than once.
+
+When tests of one file do not run one after another, e.g. because of a
+reordering plugin, the same suite is ended and started again, and the
+output would contain the same suite many times. SuiteMergingOutput prevents
+that: once spooling is enabled, the events of tests and keywords are written
+to a temporary spool file, and only the suite structure and the location of
+each run of events in the spool file are kept in memory. At close, each
+suite is written out once, in the order in which the suites were first
+started, with all of its tests.
+"""
+
+import pickle
+import tempfile
+import time
+
+
+class _Suite:
+    """ A suite and its contents: child suites and runs of spooled events, in
+        the order in which they were first seen. """
+
+    __slots__ = ("name", "starttime", "endtime", "metadata", "entries",
+                 "children")
+
+    def __init__(self, name, starttime):
+        self.name = name
+        self.starttime = starttime
+        self.endtime = starttime
+        self.metadata = None
+        # _Suite, or [offset, count] of a run of spooled events
+        self.entries = []
+        self.children = {}
+
+    def child(self, name, starttime):
+        suite = self.children.get(name)
+        if suite is None:
+            suite = self.children[name] = _Suite(name, starttime)
+            self.entries.append(suite)
+        return suite
+
+
+class SuiteMergingOutput:
+    """ Output wrapper that writes each suite exactly once, even if it is
+        started many times. Events pass straight through until spool() is
+        called. """
+
+    def __init__(self, output):
+        self._output = output
+        self._spool = None
+        self._root = _Suite(None, None)
+        self._stack = [self._root]
+        # offset and event count of the run being spooled, if any
+        self._run = None
+
+    def spool(self):
+        """ Start spooling events. Must be called before the first suite
+            starts. """
+        self._spool = tempfile.TemporaryFile()
+
+    def open(self):
+        self._output.open()
+
+    def close(self):
+        if self._spool is not None:
+            now = time.time()
+            while len(self._stack) > 1:
+                self.end_suite(timestamp=now)
+            for suite in self._root.entries:
+                self._write_suite(suite)
+            self._spool.close()
+            self._spool = None
+        self._output.close()
+
+    def _write_suite(self, suite):
+        self._output.start_suite(suite.name, timestamp=suite.starttime)
+        for entry in suite.entries:
+            if isinstance(entry, _Suite):
+                self._write_suite(entry)
+            else:
+                self._replay(*entry)
+        self._output.end_suite(suite.metadata, timestamp=suite.endtime)
+
+    def _replay(self, offset, count):
+        self._spool.seek(offset)
+        for _ in range(count):
+            method, args, timestamp = pickle.load(self._spool)
+            getattr(self._output, method)(*args, timestamp=timestamp)
+
+    def _event(self, method, args, timestamp):
+        if self._spool is None:
+            getattr(self._output, method)(*args, timestamp=timestamp)
+            return
+        if self._run is None:
+            self._spool.seek(0, 2)
+            self._run = [self._spool.tell(), 0]
+            self._stack[-1].entries.append(self._run)
+        pickle.dump((method, args, timestamp or time.time()), self._spool,
+                    pickle.HIGHEST_PROTOCOL)
+        self._run[1] += 1
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        if self._spool is None:
+            self._output.start_suite(name, timestamp=timestamp)
+            return
+        self._run = None
+        self._stack.append(
+            self._stack[-1].child(name, timestamp or time.time()))
+
+    def end_suite(self, metadata=None, timestamp=None):
+        if self._spool is None:
+            self._output.end_suite(metadata, timestamp=timestamp)
+            return
+        self._run = None
+        suite = self._stack.pop()
+        suite.endtime = timestamp or time.time()
+        if metadata:
+            suite.metadata = dict(suite.metadata or {}, **metadata)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._event("start_test", (name, doc, tags), timestamp)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._event("end_test", (error_msg, tags), timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        self._event("start_keyword", (name, kwtype, args), timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        self._event("end_keyword", (error_msg,), timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        self._event("log_message", (msg, level), timestamp)
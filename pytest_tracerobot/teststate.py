@@ -0,0 +1,56 @@
+""" Per-test state of the plugin.
+
+A RunningTest record exists only while its test is being written to the
+output: it is created when the test starts and dropped when the test ends.
+Pytest keeps its items alive for the whole session, so no state is stored
+on the items themselves.
+
+A test with function-scope fixtures goes through the phases SETUP, BODY and
+TEARDOWN. A test without them starts directly in BODY and ends after it.
+"""
+
+import time
+
+SETUP = "setup"
+BODY = "body"
+TEARDOWN = "teardown"
+
+_TRANSITIONS = {
+    SETUP: (BODY,),
+    BODY: (TEARDOWN,),
+    TEARDOWN: (),
+}
+
+
+class RunningTest:
+    """ State of a test that has been started but not yet ended. """
+
+    __slots__ = ("phase", "with_setup_and_teardown", "error_msg",
+                 "teardown_error_msg", "starttime")
+
+    def __init__(self, with_setup_and_teardown=False):
+        self.starttime = time.perf_counter()
+        self.phase = SETUP if with_setup_and_teardown else BODY
+        self.with_setup_and_teardown = with_setup_and_teardown
+        self.error_msg = None
+        self.teardown_error_msg = None
+
+    def advance(self, phase):
+        if phase not in _TRANSITIONS[self.phase]:
+            raise ValueError("Invalid test phase transition: %s -> %s" % (
+                self.phase, phase))
+        self.phase = phase
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.starttime
+
+    def combined_error_msg(self):
+        """ Return earlier error message(s) from the setup, body and
+            teardown phases. """
+        msgs = []
+        if self.error_msg:
+            msgs.append(self.error_msg)
+        if self.teardown_error_msg:
+            msgs.append("Error in Teardown: " + self.teardown_error_msg)
+        return " ".join(msgs) or None
@@ -0,0 +1,258 @@
+""" Keyword lanes of threads and asyncio tasks.
+
+The output is a single tree of keywords, written as the events arrive.
+Threads and asyncio tasks run interleaved, so their keywords can not be
+written as they happen. Instead, each thread or task records its events in
+a lane of its own, without locking, and hands the lane over when its
+outermost keyword ends. The completed lanes are written at the next event
+that is not in a lane, in order of their start, each thread or task in a
+"Thread <name>" or "Task <name>" keyword, with the original timestamps.
+
+With --autotrace-threads, threads started during a test are traced, and
+written in ThreadLanes. TaskLanes is always used: the keywords of
+coroutines stay open while they await (see tracer.py), and the tasks that
+run concurrently, e.g. with asyncio.gather(), are written as sibling lanes.
+
+At the end of the test, the lanes that are still inside a keyword are
+written as far as they got, with a warning. Their later events are not
+written.
+
+Log records are recorded in the lanes as they are, and passed to log_sink
+(e.g. LogFlood.put) when their lane is written, so that flood control and
+the log queue see them in the order of the output.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from .logbridge import format_message
+
+STILL_RUNNING = "Still running at the end of the test"
+
+
+class _Lane:
+    """ Events of a thread or task from the start to the end of its
+        outermost keyword. """
+
+    __slots__ = ("key", "name", "generation", "events", "depth")
+
+    def __init__(self, key, name, generation):
+        self.key = key
+        self.name = name
+        self.generation = generation
+        self.events = []
+        self.depth = 0
+
+
+class _LaneOutput:
+    """ Base of output wrappers that write the events of some threads or
+        tasks as lanes. """
+
+    LABEL = None
+
+    def __init__(self, output, log_sink=None):
+        self._output = output
+        # called with the log records, by default written to output
+        self._log_sink = log_sink or self._write_record
+        # Incremented at the start and the end of each test; lanes of other
+        # generations are dropped.
+        self._generation = 0
+        self._in_test = False
+        # completed lanes, appended by their threads
+        self._completed = deque()
+        # lanes that are inside a keyword, by key
+        self._lanes = {}
+
+    def open(self):
+        self._output.open()
+
+    def close(self):
+        self._lanes.clear()
+        self._output.close()
+
+    def _current(self):
+        """ Return the key and the name of the lane of the current event, or
+            None if it is written directly. """
+        raise NotImplementedError
+
+    def in_lane(self):
+        return self._current() is not None
+
+    def _record(self, method, args, timestamp, depth_change=0):
+        """ Record an event in the current lane. Returns False if there is
+            none. """
+        current = self._current()
+        if current is None:
+            return False
+        key, name = current
+        lane = self._lanes.get(key)
+        if lane is None:
+            if depth_change < 0:
+                # keyword started before the lane
+                return True
+            lane = _Lane(key, name, self._generation)
+        if lane.generation == self._generation:
+            lane.events.append((method, args, timestamp or time.time()))
+        lane.depth += depth_change
+        if lane.depth > 0:
+            self._lanes[key] = lane
+            return True
+        self._lanes.pop(key, None)
+        if lane.generation == self._generation:
+            self._completed.append(lane)
+        return True
+
+    def _write_lanes(self, lanes):
+        """ Write lanes, (key, name, events) tuples, in order of their start.
+            Consecutive lanes of the same key share one keyword. """
+        output = self._output
+        lanes = sorted(lanes, key=lambda lane: lane[2][0][2])
+        key = name = last = None
+        for lane_key, lane_name, events in lanes:
+            if name is None or lane_key != key:
+                if name is not None:
+                    output.end_keyword(timestamp=last)
+                key, name = lane_key, lane_name
+                output.start_keyword("%s %s" % (self.LABEL, name),
+                                     timestamp=events[0][2])
+            for method, args, timestamp in events:
+                if method == "log_record":
+                    self._log_sink(*args)
+                else:
+                    getattr(output, method)(*args, timestamp=timestamp)
+            last = events[-1][2]
+        if name is not None:
+            output.end_keyword(timestamp=last)
+
+    def _take_completed(self):
+        completed = self._completed
+        lanes = []
+        while completed:
+            lane = completed.popleft()
+            if self._in_test and lane.generation == self._generation:
+                lanes.append(lane)
+        return lanes
+
+    def _drain(self):
+        """ Write the completed lanes of the current test. """
+        self._write_lanes([(lane.key, lane.name, lane.events)
+                           for lane in self._take_completed()])
+
+    def _end_lanes(self, timestamp):
+        """ Write the completed lanes and the running ones as far as they
+            got. """
+        running = [lane for lane in list(self._lanes.values())
+                   if lane.generation == self._generation]
+        lanes = self._take_completed()
+        written = {id(lane) for lane in lanes}
+        lanes = [(lane.key, lane.name, lane.events) for lane in lanes]
+        now = timestamp or time.time()
+        for lane in running:
+            if id(lane) in written:
+                continue
+            events = list(lane.events)
+            depth = 0
+            for method, _, _ in events:
+                if method == "start_keyword":
+                    depth += 1
+                elif method == "end_keyword":
+                    depth -= 1
+            if depth > 0:
+                events.append(("log_message", (STILL_RUNNING, "WARN"), now))
+                events.extend([("end_keyword", (None,), now)] * depth)
+            if events:
+                lanes.append((lane.key, lane.name, events))
+        self._write_lanes(lanes)
+
+    def _write_record(self, record):
+        self._output.log_message(format_message(record), record.levelname,
+                                 timestamp=record.created)
+
+    def log_record(self, record):
+        """ Pass a logging record to log_sink, or record it in the current
+            lane. The record is formatted right away, as its arguments may
+            be changed before the lane is written. """
+        record.message = format_message(record)
+        if self._record("log_record", (record,), record.created):
+            return
+        if self._completed:
+            self._drain()
+        self._log_sink(record)
+
+    # Output interface
+
+    def start_suite(self, name, timestamp=None):
+        self._output.start_suite(name, timestamp=timestamp)
+
+    def end_suite(self, metadata=None, timestamp=None):
+        self._output.end_suite(metadata, timestamp=timestamp)
+
+    def start_test(self, name, doc=None, tags=None, timestamp=None):
+        self._generation += 1
+        self._in_test = True
+        self._output.start_test(name, doc, tags, timestamp=timestamp)
+
+    def end_test(self, error_msg=None, tags=None, timestamp=None):
+        self._end_lanes(timestamp)
+        self._generation += 1
+        self._in_test = False
+        self._output.end_test(error_msg, tags, timestamp=timestamp)
+
+    def start_keyword(self, name, kwtype="kw", args=None, timestamp=None):
+        if self._record("start_keyword", (name, kwtype, args), timestamp, 1):
+            return
+        if self._completed:
+            self._drain()
+        self._output.start_keyword(name, kwtype, args, timestamp=timestamp)
+
+    def end_keyword(self, error_msg=None, timestamp=None):
+        if self._record("end_keyword", (error_msg,), timestamp, -1):
+            return
+        if self._completed:
+            self._drain()
+        self._output.end_keyword(error_msg, timestamp=timestamp)
+
+    def log_message(self, msg, level="INFO", timestamp=None):
+        if self._record("log_message", (msg, level), timestamp):
+            return
+        if self._completed:
+            self._drain()
+        self._output.log_message(msg, level, timestamp=timestamp)
+
+
+class ThreadLanes(_LaneOutput):
+    """ Output wrapper that writes the events of other threads than the one
+        that opened it as lanes. """
+
+    LABEL = "Thread"
+
+    def __init__(self, output, log_sink=None):
+        super(ThreadLanes, self).__init__(output, log_sink)
+        self._main = None
+
+    def open(self):
+        self._main = threading.get_ident()
+        super(ThreadLanes, self).open()
+
+    def _current(self):
+        ident = threading.get_ident()
+        if ident == self._main:
+            return None
+        return ident, threading.current_thread().name
+
+
+class TaskLanes(_LaneOutput):
+    """ Output wrapper that writes the events of asyncio tasks as lanes. """
+
+    LABEL = "Task"
+
+    def _current(self):
+        loop = asyncio._get_running_loop()
+        if loop is None:
+            return None
+        task = asyncio.current_task(loop)
+        if task is None:
+            return None
+        return task, task.get_name()
@@ -0,0 +1,689 @@
+""" Automatic tracing of Python function calls into keywords.
+
+Functions defined in the files under the current working directory, and
+under the configured library paths, are recorded as keywords while the
+autotracer is running. Calls into silenced paths (such as pytest internals)
+are not recorded. When a keyword calls into a silenced path, nothing called
+from there is recorded either.
+
+Two backends are available: AutoTracer, based on sys.settrace, and
+MonitoringAutoTracer, based on sys.monitoring (PEP 669, Python 3.12+). The
+latter disables the events of untraced code objects altogether, so that
+code runs at full speed. Both record the same keywords.
+
+A coroutine (or async generator) is one keyword from its start to its
+return, however many times it awaits in between. Its keyword ends with a
+message of the time it was running ("active") and the time it was
+suspended ("awaiting"). As the tasks of an event loop run interleaved, the
+output must write the keywords of each task separately (see threads.py).
+With coroutines=False, each run of a coroutine up to its next await is a
+keyword of its own instead, for outputs that write events as they happen.
+"""
+
+import copy
+import dis
+import os
+import sys
+import sysconfig
+import threading
+import time
+import warnings
+
+from .capture import CapturePolicy
+
+# Instructions at which a frame returns normally. A 'return' trace event at
+# any other instruction means that an exception is propagating.
+_RETURN_OPS = {dis.opmap[name]
+               for name in ("RETURN_VALUE", "RETURN_CONST", "YIELD_VALUE")
+               if name in dis.opmap}
+
+# Instructions at which a coroutine frame is suspended
+_SUSPEND_OPS = {dis.opmap[name] for name in ("YIELD_VALUE", "YIELD_FROM")
+                if name in dis.opmap}
+
+_CO_ASYNC = 0x0080 | 0x0200     # CO_COROUTINE | CO_ASYNC_GENERATOR
+
+# Trace decisions for code objects
+TRACE = 1
+SKIP = 2
+SILENT = 3
+
+# Installed packages and the standard library are only traced if they are
+# explicitly listed in the libpaths.
+_SYSTEM_PATHS = {sysconfig.get_paths()[name]
+                 for name in ("stdlib", "platstdlib", "purelib", "platlib")}
+
+_PLUGIN_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def _normpath(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class PathTrie:
+    """ Prefix trie of normalized directory paths, keyed by path component.
+        Each registered prefix carries a set of categories. """
+
+    def __init__(self):
+        self._root = {}
+
+    @staticmethod
+    def _parts(path):
+        return [part for part in _normpath(path).split(os.sep) if part]
+
+    def add(self, path, category):
+        node = self._root
+        for part in self._parts(path):
+            node = node.setdefault(part, {})
+        node.setdefault(None, set()).add(category)
+
+    def categories(self, path):
+        """ Return the union of categories of all prefixes of path. """
+        found = set()
+        node = self._root
+        for part in self._parts(path):
+            node = node.get(part)
+            if node is None:
+                break
+            found.update(node.get(None, ()))
+        return found
+
+
+# Path categories
+_SILENT = "silent"
+_LIBPATH = "libpath"
+_SYSTEM = "system"
+_ROOT = "root"
+
+
+class TraceFilter:
+    """ Decides whether calls of a code object are traced.
+
+        The decision depends only on the code object, so it is computed once
+        per code object and then looked up from a cache. Path matching is
+        done once per source file with a prefix trie of the cwd, libpaths,
+        silent paths and system paths.
+    """
+
+    def __init__(self, libpaths=None, silentpaths=None, privates=False,
+                 rootpath=None):
+        self._privates = privates
+        self._trie = PathTrie()
+        self._trie.add(rootpath or os.getcwd(), _ROOT)
+        for path in _SYSTEM_PATHS:
+            self._trie.add(path, _SYSTEM)
+        for path in libpaths or []:
+            self._trie.add(path, _LIBPATH)
+        for path in list(silentpaths or []) + [_PLUGIN_PATH]:
+            self._trie.add(path, _SILENT)
+
+        # id(code) -> (code, decision); the code object is kept to make
+        # sure that the id is not reused.
+        self._cache = {}
+        self._files = {}
+        self.hits = 0
+        self.misses = 0
+
+    def decide(self, code):
+        """ Return TRACE, SKIP or SILENT for a code object. """
+        entry = self._cache.get(id(code))
+        if entry is not None and entry[0] is code:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        decision = self._decide(code)
+        self._cache[id(code)] = (code, decision)
+        return decision
+
+    def hide(self, code):
+        """ Skip calls of code that would be traced, e.g. because the plugin
+            writes them as keywords itself. The code called by it is still
+            traced. """
+        if self.decide(code) == TRACE:
+            self._cache[id(code)] = (code, SKIP)
+
+    def _file_categories(self, filename):
+        categories = self._files.get(filename)
+        if categories is None:
+            categories = self._trie.categories(filename)
+            self._files[filename] = categories
+        return categories
+
+    def _decide(self, code):
+        name = code.co_name
+        if code.co_filename.startswith("<"):
+            # frozen modules, code compiled from strings
+            return SKIP
+        categories = self._file_categories(code.co_filename)
+
+        if _SILENT in categories:
+            return SILENT
+        if name.startswith("<"):
+            # module level code, lambdas, comprehensions
+            return SKIP
+        if name.startswith("_") and not self._privates:
+            return SKIP
+        if _LIBPATH in categories:
+            return TRACE
+        if _SYSTEM in categories:
+            return SKIP
+        if _ROOT in categories:
+            return TRACE
+        return SKIP
+
+
+class _CoroutineTime:
+    """ Active and awaiting time of a coroutine keyword. """
+
+    __slots__ = ("started", "resumed", "active")
+
+    def __init__(self):
+        self.started = self.resumed = time.perf_counter()
+        self.active = 0.0
+
+    def suspend(self):
+        self.active += time.perf_counter() - self.resumed
+
+    def resume(self):
+        self.resumed = time.perf_counter()
+
+    def message(self):
+        now = time.perf_counter()
+        active = self.active + now - self.resumed
+        return "Active %.3f s, awaiting %.3f s" % (
+            active, now - self.started - active)
+
+
+def format_error(exc_value):
+    name = type(exc_value).__name__
+    msg = str(exc_value)
+    if msg:
+        return "%s: %s" % (name, msg)
+    return name
+
+
+class AutoTracer:
+    """ Records calls of traced functions as keywords to output, using
+        sys.settrace.
+
+        With threads=True, threads started while the tracer is running are
+        traced too, each by its own copy of the tracer (see thread_tracer),
+        until the tracer is stopped. Their events go to the same output,
+        which must tell the threads apart.
+
+        With coroutines=False, the keyword of a coroutine ends when it
+        awaits, and a new one starts when it is resumed.
+    """
+
+    # Trace callbacks, as instance attribute names
+    CALLBACKS = ("_trace_call", "_trace_silent", "_trace_keyword")
+
+    def __init__(self, output, libpaths=None, silentpaths=None,
+                 privates=False, capture=None, threads=False, rootpath=None,
+                 coroutines=True):
+        self._output = output
+        self._threads = threads
+        self._coroutines = coroutines
+        self._libpaths = list(libpaths or [])
+        self._silentpaths = silentpaths
+        self._privates = privates
+        self._rootpath = rootpath
+        self.filter = TraceFilter(libpaths, silentpaths, privates, rootpath)
+        self.decide = self.filter.decide
+        self.capture = capture or CapturePolicy()
+        # TraceFilter by extra libpaths, and code hidden in all of them
+        self._filters = {(): self.filter}
+        self._hidden = set()
+        # keywords nested deeper than this are not written
+        self.max_depth = sys.maxsize
+
+        self._init_thread_state()
+        self._prev_trace = None
+        self._prev_thread_trace = None
+        # tracer that created this thread tracer, and its start count then
+        self._parent = None
+        self._generation = 0
+        self.running = False
+
+    def _init_thread_state(self):
+        """ Initialize the state of the traced thread. """
+        self._kwtype = "kw"
+        self._silent = 0
+        # exception info, lazily captured arguments and coroutine time of
+        # each open keyword, innermost last
+        self._exceptions = []
+        self._arg_refs = []
+        self._times = []
+        # the above of each suspended coroutine keyword, by frame
+        self._suspended = {}
+
+    def thread_tracer(self):
+        """ Return a tracer for the current thread. It shares the output,
+            the filter and the settings of this tracer. """
+        tracer = copy.copy(self)
+        # drop callbacks replaced on the instance, e.g. for profiling, as
+        # they are bound to this tracer
+        for name in self.CALLBACKS:
+            tracer.__dict__.pop(name, None)
+        tracer._init_thread_state()
+        tracer._parent = self
+        return tracer
+
+    def close(self):
+        self.stop()
+
+    def set_kwtype(self, kwtype):
+        """ Set type of the next keyword. Returns automatically to 'kw'. """
+        self._kwtype = kwtype
+
+    def hide(self, code):
+        """ Skip calls of code, see TraceFilter.hide. """
+        if code in self._hidden:
+            return
+        self._hidden.add(code)
+        for trace_filter in self._filters.values():
+            trace_filter.hide(code)
+
+    def use_libpaths(self, extra):
+        """ Trace the paths extra in addition to the libpaths given at
+            creation, until called again. """
+        key = tuple(extra or ())
+        trace_filter = self._filters.get(key)
+        if trace_filter is None:
+            trace_filter = self._filters[key] = TraceFilter(
+                self._libpaths + list(key), self._silentpaths, self._privates,
+                self._rootpath)
+            for code in self._hidden:
+                trace_filter.hide(code)
+        if trace_filter is not self.filter:
+            self.filter = trace_filter
+            self.decide = trace_filter.decide
+            self._filter_changed()
+
+    @property
+    def filters(self):
+        return list(self._filters.values())
+
+    def _filter_changed(self):
+        pass
+
+    def _start_threads(self, trace_function):
+        if self._threads:
+            self._prev_thread_trace = getattr(threading, "gettrace",
+                                              lambda: None)()
+            threading.settrace(trace_function)
+
+    def _stop_threads(self):
+        if self._threads:
+            threading.settrace(self._prev_thread_trace)
+            self._prev_thread_trace = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._generation += 1
+        self._prev_trace = sys.gettrace()
+        sys.settrace(self._trace_call)
+        self._start_threads(self._trace_new_thread)
+
+    def stop(self):
+        if not self.running:
+            return
+        sys.settrace(self._prev_trace)
+        self._stop_threads()
+        self._prev_trace = None
+        self.running = False
+        self._silent = 0
+        self._suspended.clear()
+        while self._exceptions:
+            self.end_keyword("Autotrace stopped")
+
+    def abandon(self):
+        """ Stop tracing without ending the open keywords, e.g. in a forked
+            process. """
+        self._init_thread_state()
+        self.stop()
+
+    @staticmethod
+    def keyword_name(code):
+        return getattr(code, "co_qualname", code.co_name)
+
+    def keyword_args(self, frame):
+        """ Return (args, refs) of the function call in frame, as rendered
+            by the capture policy. """
+        code = frame.f_code
+        count = code.co_argcount + code.co_kwonlyargcount
+        names = list(code.co_varnames[:count])
+        if code.co_flags & 0x04:    # CO_VARARGS
+            names.append(code.co_varnames[count])
+            count += 1
+        if code.co_flags & 0x08:    # CO_VARKEYWORDS
+            names.append(code.co_varnames[count])
+
+        f_locals = frame.f_locals
+        names = [name for name in names
+                 if name not in ("self", "cls") and name in f_locals]
+        return self.capture.capture(names, [f_locals[name] for name in names])
+
+    def start_keyword(self, code, frame):
+        kwtype = self._kwtype
+        self._kwtype = "kw"
+        args, refs = self.keyword_args(frame)
+        self._output.start_keyword(self.keyword_name(code), kwtype, args)
+        self._exceptions.append(None)
+        self._arg_refs.append(refs)
+        self._times.append(
+            _CoroutineTime() if self._coroutines and code.co_flags & _CO_ASYNC
+            else None)
+
+    def end_keyword(self, error_msg=None):
+        self._exceptions.pop()
+        refs = self._arg_refs.pop()
+        coroutine_time = self._times.pop()
+        if error_msg and refs is not None:
+            self._output.log_message(
+                "Arguments: " + self.capture.render_refs(refs))
+        if coroutine_time is not None:
+            self._output.log_message(coroutine_time.message())
+        self._output.end_keyword(error_msg)
+
+    def suspend_keyword(self, frame):
+        """ Keep the innermost keyword, of the coroutine in frame, open
+            while the coroutine awaits. """
+        coroutine_time = self._times.pop()
+        coroutine_time.suspend()
+        self._suspended[frame] = (self._exceptions.pop(),
+                                  self._arg_refs.pop(), coroutine_time)
+
+    def resume_keyword(self, frame):
+        """ Continue the keyword of the coroutine in frame. Returns False if
+            it is not suspended. """
+        suspended = self._suspended.pop(frame, None)
+        if suspended is None:
+            return False
+        exc_info, refs, coroutine_time = suspended
+        coroutine_time.resume()
+        self._exceptions.append(exc_info)
+        self._arg_refs.append(refs)
+        self._times.append(coroutine_time)
+        return True
+
+    # sys.settrace callbacks
+
+    def _trace_new_thread(self, frame, event, arg):
+        """ First call in a thread started while tracing. """
+        if not self.running:
+            sys.settrace(None)
+            return None
+        tracer = self.thread_tracer()
+        sys.settrace(tracer._trace_thread_call)
+        return tracer._trace_thread_call(frame, event, arg)
+
+    def _trace_thread_call(self, frame, event, arg):
+        parent = self._parent
+        if not parent.running or parent._generation != self._generation:
+            # The tracing that this thread was started in has ended; its
+            # open keywords are not written.
+            sys.settrace(None)
+            self._init_thread_state()
+            return None
+        return self._trace_call(frame, event, arg)
+
+    def _trace_call(self, frame, event, arg):
+        if self._silent:
+            return None
+        if self._suspended and self.resume_keyword(frame):
+            return self._trace_keyword
+
+        decision = self.decide(frame.f_code)
+        if decision == SKIP:
+            return None
+
+        # Calls below the maximum depth are silenced like library internals
+        if decision == SILENT or len(self._exceptions) >= self.max_depth:
+            if not self._exceptions:
+                # no keyword open, e.g. the pytest runner calling a test
+                return None
+            frame.f_trace_lines = False
+            self._silent += 1
+            return self._trace_silent
+
+        frame.f_trace_lines = False
+
+        self.start_keyword(frame.f_code, frame)
+        return self._trace_keyword
+
+    def _trace_silent(self, frame, event, arg):
+        if event == "return":
+            self._silent -= 1
+        return self._trace_silent
+
+    def _trace_keyword(self, frame, event, arg):
+        if not self._exceptions:
+            # tracer was stopped while this frame was running
+            return None
+
+        if event == "exception":
+            self._exceptions[-1] = arg
+        elif event == "return":
+            error_msg = None
+            exc_info = self._exceptions[-1]
+            code = frame.f_code
+            op = code.co_code[frame.f_lasti]
+            suspended = code.co_flags & _CO_ASYNC and op in _SUSPEND_OPS
+            if suspended and self._coroutines:
+                self.suspend_keyword(frame)
+                return self._trace_keyword
+            if exc_info and op not in _RETURN_OPS and not suspended:
+                error_msg = format_error(exc_info[1])
+            self.end_keyword(error_msg)
+        return self._trace_keyword
+
+
+class MonitoringAutoTracer(AutoTracer):
+    """ AutoTracer backend using sys.monitoring events.
+
+        Code objects that are not traced get their events disabled, after
+        which they run without any tracing overhead. Like sys.settrace, only
+        the thread that started the tracer is traced, and with threads=True
+        the threads it starts; their events are passed on to their own
+        tracers.
+    """
+
+    CALLBACKS = ("_on_start", "_on_resume", "_on_throw", "_on_return",
+                 "_on_yield", "_on_unwind")
+
+    def __init__(self, *args, **kwargs):
+        super(MonitoringAutoTracer, self).__init__(*args, **kwargs)
+        monitoring = sys.monitoring
+        self._tool = monitoring.PROFILER_ID
+        monitoring.use_tool_id(self._tool, "pytest-tracerobot")
+        # Earlier sessions in the same process may have disabled events
+        monitoring.restart_events()
+
+        events = monitoring.events
+        self._events = (events.PY_START | events.PY_RESUME | events.PY_THROW |
+                        events.PY_RETURN | events.PY_YIELD | events.PY_UNWIND)
+
+        # tracer of each thread started while tracing, by thread id
+        self._thread_tracers = {}
+
+    def _init_thread_state(self):
+        super(MonitoringAutoTracer, self)._init_thread_state()
+        # (code, silent) for each open keyword or silenced call
+        self._codes = []
+        self._thread_id = threading.get_ident()
+
+    def close(self):
+        self.stop()
+        sys.monitoring.free_tool_id(self._tool)
+
+    def _filter_changed(self):
+        # Events of code skipped by the previous filter have been disabled
+        sys.monitoring.restart_events()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread_id = threading.get_ident()
+        # Callbacks are registered on each start, so that they can be
+        # replaced on the instance (e.g. for profiling)
+        events = sys.monitoring.events
+        callbacks = {
+            events.PY_START: self._on_start,
+            events.PY_RESUME: self._on_resume,
+            events.PY_THROW: self._on_throw,
+            events.PY_RETURN: self._on_return,
+            events.PY_YIELD: self._on_yield,
+            events.PY_UNWIND: self._on_unwind,
+        }
+        for event, callback in callbacks.items():
+            sys.monitoring.register_callback(self._tool, event, callback)
+        sys.monitoring.set_events(self._tool, self._events)
+        # New threads are only registered here, they are not traced with
+        # sys.settrace
+        self._start_threads(self._register_thread)
+
+    def stop(self):
+        if not self.running:
+            return
+        sys.monitoring.set_events(self._tool, sys.monitoring.events.NO_EVENTS)
+        self._stop_threads()
+        self._thread_tracers.clear()
+        self.running = False
+        self._silent = 0
+        del self._codes[:]
+        self._suspended.clear()
+        while self._exceptions:
+            self.end_keyword("Autotrace stopped")
+
+    def _register_thread(self, frame, event, arg):
+        sys.settrace(None)
+        if self.running:
+            self._thread_tracers[threading.get_ident()] = self.thread_tracer()
+        return None
+
+    def _thread_tracer_of_caller(self):
+        """ Return the tracer of the current thread, if it is followed. """
+        return self._thread_tracers.get(threading.get_ident())
+
+    @staticmethod
+    def _code_frame(code):
+        """ Return the frame of code, the nearest caller of the callback
+            that runs it. The callback may have been wrapped, e.g. for
+            profiling. """
+        frame = sys._getframe(1)
+        while frame.f_code is not code:
+            frame = frame.f_back
+        return frame
+
+    # sys.monitoring callbacks
+
+    def _on_start(self, code, offset, *_):
+        if threading.get_ident() != self._thread_id:
+            tracer = self._thread_tracer_of_caller()
+            if tracer is None:
+                return None
+            return tracer._on_start(code, offset)
+
+        decision = self.decide(code)
+        if decision == SKIP:
+            return sys.monitoring.DISABLE
+        if self._silent:
+            return None
+
+        if decision == SILENT or len(self._exceptions) >= self.max_depth:
+            if self._exceptions:
+                self._silent += 1
+                self._codes.append((code, True))
+            return None
+
+        self.start_keyword(code, self._code_frame(code))
+        self._codes.append((code, False))
+        return None
+
+    def _on_resume(self, code, offset):
+        if threading.get_ident() != self._thread_id:
+            tracer = self._thread_tracer_of_caller()
+            if tracer is None:
+                return None
+            return tracer._on_resume(code, offset)
+        if (self._suspended and not self._silent and
+                code.co_flags & _CO_ASYNC and
+                self.resume_keyword(self._code_frame(code))):
+            self._codes.append((code, False))
+            return None
+        return self._on_start(code, offset)
+
+    def _on_throw(self, code, offset, exception):
+        # PY_THROW events can not be disabled
+        self._on_resume(code, offset)
+
+    def _pop(self, code, error_msg=None):
+        if not self._codes or self._codes[-1][0] is not code:
+            return
+        _, silent = self._codes.pop()
+        if silent:
+            self._silent -= 1
+        else:
+            self.end_keyword(error_msg)
+
+    def _on_return(self, code, offset, retval):
+        if threading.get_ident() != self._thread_id:
+            tracer = self._thread_tracer_of_caller()
+            if tracer is None:
+                return None
+            return tracer._on_return(code, offset, retval)
+        if self.decide(code) == SKIP:
+            return sys.monitoring.DISABLE
+        self._pop(code)
+        return None
+
+    def _on_yield(self, code, offset, retval):
+        if threading.get_ident() != self._thread_id:
+            tracer = self._thread_tracer_of_caller()
+            if tracer is None:
+                return None
+            return tracer._on_yield(code, offset, retval)
+        if self.decide(code) == SKIP:
+            return sys.monitoring.DISABLE
+        if (self._coroutines and code.co_flags & _CO_ASYNC and
+                self._codes and self._codes[-1][0] is code and
+                not self._codes[-1][1]):
+            self._codes.pop()
+            self.suspend_keyword(self._code_frame(code))
+            return None
+        self._pop(code)
+        return None
+
+    def _on_unwind(self, code, offset, exception):
+        # PY_UNWIND events can not be disabled
+        if threading.get_ident() != self._thread_id:
+            tracer = self._thread_tracer_of_caller()
+            if tracer is not None:
+                tracer._on_unwind(code, offset, exception)
+        elif self._codes:
+            self._pop(code, format_error(exception))
+
+
+AUTOTRACE_BACKENDS = ["settrace", "monitoring"]
+
+
+def create_autotracer(backend, output, **kwargs):
+    """ Create autotracer for backend, falling back to settrace if
+        sys.monitoring is not available. """
+    if backend == "monitoring":
+        if hasattr(sys, "monitoring"):
+            try:
+                return MonitoringAutoTracer(output, **kwargs)
+            except ValueError as err:
+                # monitoring tool id already in use
+                warnings.warn("sys.monitoring autotrace backend is not "
+                              "available (%s), using settrace" % err)
+        else:
+            warnings.warn("sys.monitoring autotrace backend requires "
+                          "Python 3.12 or newer, using settrace")
+    return AutoTracer(output, **kwargs)
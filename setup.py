@@ -4,9 +4,15 @@ from setuptools import setup
 setup(
     name="pytest_tracerobot",
     version="0.3.1",
-    scripts=["pytest_tracerobot.py"],
+    packages=["pytest_tracerobot"],
     # the following makes a plugin available to pytest
-    entry_points={"pytest11": ["name_of_plugin=pytest_tracerobot"]},
+    entry_points={
+        "pytest11": ["name_of_plugin=pytest_tracerobot"],
+        "console_scripts": [
+            "tracerobot-convert=pytest_tracerobot.journal:main",
+            "tracerobot-merge=pytest_tracerobot.split:main",
+        ],
+    },
     # custom PyPI classifier for pytest plugins
     classifiers=["Framework :: Pytest"],
     install_requires=["tracerobot >= 0.3.1", "pytest >= 5.3.5"]
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+""" Plugin overhead benchmark.
+
+Generates synthetic test projects and runs each of them in four modes:
+plain pytest, the plugin installed but not enabled, the plugin with
+--no-autotrace, and the plugin with full autotracing. For each run, the
+wall time, the overhead per test compared to plain pytest, the peak RSS and
+the size of the output XML are reported as JSON.
+
+The scenarios exercise the things the plugin hooks into: function fixtures
+with setup and teardown (like fixtureWithSetupAndTeardown1/2 in test.py), a
+module fixture, nested keyword calls, logging and passing asserts (with
+enable_assertion_pass_hook). The startup scenario has a single test, so
+that it measures the startup time of pytest; with the plugin disabled, it
+should match plain pytest.
+
+The runs of the modes take turns, so that a machine that slows down or
+speeds up during the benchmark affects all modes alike.
+
+With --baseline, the results are compared to a baseline file written
+earlier with --save-baseline, and the script fails if the wall time or the
+peak RSS of the plugin relative to plain pytest (overhead_ratio, rss_ratio)
+exceeds the baseline by more than --margin in any scenario and mode,
+including the disabled plugin. Only these ratios are compared; the absolute
+figures in the report depend on the machine. The ratios depend on it too,
+to a lesser degree, so the baseline should be written on the machine that
+runs the comparison.
+
+    ./benchmark.py [--report report.json] [--baseline benchmark_baseline.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# name: (tests, function fixtures, keyword depth, keyword width,
+#        log messages per keyword, asserts per test)
+SCENARIOS = {
+    "startup": (1, 0, 0, 1, 0, 1),
+    "flat": (2000, 0, 0, 1, 0, 1),
+    "fixtures": (1000, 2, 0, 1, 0, 1),
+    "keywords": (500, 0, 3, 3, 0, 1),
+    "logging": (500, 0, 1, 2, 10, 1),
+    "asserts": (500, 0, 0, 1, 0, 50),
+}
+
+MODES = {
+    "plain": ["-p", "no:name_of_plugin"],
+    "disabled": [],
+    "no-autotrace": ["--tracerobot", "--no-autotrace"],
+    "autotrace": ["--tracerobot"],
+}
+
+# Metrics compared against the baseline, relative to plain pytest
+GATED_METRICS = ("overhead_ratio", "rss_ratio")
+
+INI_TEMPLATE = '''[pytest]
+enable_assertion_pass_hook = true
+'''
+
+CONFTEST_HEADER = '''import pytest
+
+def setup_step(index):
+    return index
+
+def teardown_step(index):
+    return index
+
+@pytest.fixture(scope="module")
+def moduleFixture():
+    yield setup_step(0)
+    teardown_step(0)
+'''
+
+FIXTURE_TEMPLATE = '''
+@pytest.fixture
+def fixtureWithSetupAndTeardown{index}():
+    yield setup_step({index})
+    teardown_step({index})
+'''
+
+MODULE_HEADER = '''import logging
+
+log = logging.getLogger("benchmark")
+
+def keyword(depth):
+    for index in range({logs}):
+        log.info("keyword message %d", index)
+    if depth > 0:
+        for _ in range({width}):
+            keyword(depth - 1)
+    return depth
+'''
+
+TEST_TEMPLATE = '''
+def test_{index}({fixtures}):
+    keyword({depth})
+    for index in range({asserts}):
+        assert index == index
+'''
+
+TESTS_PER_FILE = 100
+
+
+def generate_project(path, scenario):
+    tests, fixtures, depth, width, logs, asserts = scenario
+    with open(os.path.join(path, "pytest.ini"), "w") as ini_file:
+        ini_file.write(INI_TEMPLATE)
+    with open(os.path.join(path, "conftest.py"), "w") as conftest:
+        conftest.write(CONFTEST_HEADER)
+        for index in range(1, fixtures + 1):
+            conftest.write(FIXTURE_TEMPLATE.format(index=index))
+
+    fixture_args = ", ".join(["moduleFixture"] + [
+        "fixtureWithSetupAndTeardown%d" % index
+        for index in range(1, fixtures + 1)])
+    for first in range(0, tests, TESTS_PER_FILE):
+        filename = os.path.join(path, "test_gen_%06d.py" % first)
+        with open(filename, "w") as test_file:
+            test_file.write(MODULE_HEADER.format(logs=logs, width=width))
+            for index in range(first, min(first + TESTS_PER_FILE, tests)):
+                test_file.write(TEST_TEMPLATE.format(
+                    index=index, fixtures=fixture_args, depth=depth,
+                    asserts=asserts))
+
+
+def run_pytest(path, args):
+    """ Run pytest in path and return (wall time in seconds, peak RSS in
+        kilobytes). """
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd + args, cwd=path,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode not in (0, 1):
+        raise RuntimeError("pytest %s failed with exit code %d" % (
+            " ".join(args), proc.returncode))
+    return wall, rusage.ru_maxrss
+
+
+def run_scenario(name, scenario, writer, repeat):
+    tests = scenario[0]
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        generate_project(path, scenario)
+        output = os.path.join(path, "output.xml")
+        runs = {mode: [] for mode in MODES}
+        output_bytes = dict.fromkeys(MODES, 0)
+        for _ in range(repeat):
+            for mode, mode_args in MODES.items():
+                args = list(mode_args)
+                if "--tracerobot" in args:
+                    args += ["--robot-writer", writer,
+                             "--robot-output", output]
+                runs[mode].append(run_pytest(path, args))
+                if os.path.exists(output):
+                    output_bytes[mode] = os.path.getsize(output)
+                    os.remove(output)
+        for mode in MODES:
+            results[mode] = {
+                "wall_s": min(wall for wall, _ in runs[mode]),
+                "rss_kb": max(rss for _, rss in runs[mode]),
+                "output_bytes": output_bytes[mode],
+            }
+
+    plain = results["plain"]
+    for mode in MODES:
+        result = results[mode]
+        result["overhead_ratio"] = result["wall_s"] / plain["wall_s"]
+        result["per_test_overhead_ms"] = (
+            (result["wall_s"] - plain["wall_s"]) * 1000.0 / tests)
+        result["rss_overhead_kb"] = result["rss_kb"] - plain["rss_kb"]
+        result["rss_ratio"] = result["rss_kb"] / plain["rss_kb"]
+    print("%-10s %s" % (name, "  ".join(
+        "%s %.2fs (x%.2f)" % (mode, results[mode]["wall_s"],
+                              results[mode]["overhead_ratio"])
+        for mode in MODES)), file=sys.stderr)
+    return {"tests": tests, "modes": results}
+
+
+def compare(report, baseline, margin):
+    """ Return a list of regressions of report compared to baseline. """
+    regressions = []
+    for name, scenario in report["scenarios"].items():
+        base_scenario = baseline["scenarios"].get(name)
+        if base_scenario is None:
+            continue
+        for mode, result in scenario["modes"].items():
+            if mode == "plain":
+                continue
+            base = base_scenario["modes"].get(mode, {})
+            for metric in GATED_METRICS:
+                if metric not in base:
+                    continue
+                if result[metric] > base[metric] * (1 + margin):
+                    regressions.append(
+                        "%s/%s: %s %.3f exceeds baseline %.3f + %d%%" % (
+                            name, mode, metric, result[metric],
+                            base[metric], margin * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument("--writer", default="stream")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per mode; the fastest one is reported")
+    parser.add_argument("--report", help="write the JSON report here "
+                                         "(default: stdout)")
+    parser.add_argument("--baseline", help="fail on regressions against "
+                                           "this baseline report")
+    parser.add_argument("--margin", type=float, default=0.25,
+                        help="allowed relative regression (default: 0.25)")
+    parser.add_argument("--save-baseline", metavar="PATH",
+                        help="write the report as a new baseline")
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "writer": args.writer,
+        "scenarios": {
+            name: run_scenario(name, SCENARIOS[name], args.writer,
+                               args.repeat)
+            for name in args.scenarios
+        },
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            report_file.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            baseline_file.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report, baseline, args.margin)
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+""" Peak memory benchmark for the streaming writer.
+
+Generates synthetic test projects of increasing size, runs them with and
+without the plugin, and prints the peak RSS of each run. With the streaming
+writer, the plugin's share of the peak memory should stay flat while the
+number of tests grows. The last column shows the overhead per test, which
+should approach zero for large sessions: the plugin keeps no state for tests
+that have finished.
+
+    ./benchmark_memory.py [--writer stream] [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+TEST_TEMPLATE = '''
+def helper(value):
+    return value + 1
+
+def test_{index}():
+    assert helper({index}) == {index} + 1
+'''
+
+TESTS_PER_FILE = 1000
+
+
+def generate_project(path, count):
+    for first in range(0, count, TESTS_PER_FILE):
+        filename = os.path.join(path, "test_gen_%06d.py" % first)
+        with open(filename, "w") as test_file:
+            for index in range(first, min(first + TESTS_PER_FILE, count)):
+                test_file.write(TEST_TEMPLATE.format(index=index))
+
+
+def run_pytest(path, args):
+    """ Run pytest in path and return its peak RSS in kilobytes. """
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+    proc = subprocess.Popen(cmd + args, cwd=path,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # all the generated tests pass
+    if proc.returncode != 0:
+        raise RuntimeError("pytest %s failed with exit code %d" % (
+            " ".join(args), proc.returncode))
+    return rusage.ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writer", default="stream")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print("%10s %14s %14s %14s %14s" % ("tests", "plain (kB)", "plugin (kB)",
+                                        "overhead (kB)", "per test (B)"))
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as path:
+            generate_project(path, size)
+            plain = run_pytest(path, ["-p", "no:name_of_plugin"])
+            traced = run_pytest(path, ["--tracerobot",
+                                       "--robot-writer", args.writer])
+        overhead = traced - plain
+        print("%10d %14d %14d %14d %14.1f" % (
+            size, plain, traced, overhead, overhead * 1024.0 / size))
+
+
+if __name__ == "__main__":
+    main()
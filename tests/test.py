@@ -1,6 +1,11 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import pytest
 
+from pytest_tracerobot.journal import JournalWriter, convert_journal
+
 def rlog(msg):
     """ A dummy function that injects msg into trace log """
     #print(msg)
@@ -15,6 +20,23 @@ def check_sum(a,b,result):
 def fails():
     raise AssertionError()
 
+def raises_value_error():
+    raise ValueError("expected")
+
+async def fetch(n):
+    """ A dummy coroutine that awaits before it returns n """
+    await asyncio.sleep(0.01 * n)
+    rlog("fetched")
+    return n
+
+async def fetch_all():
+    return await asyncio.gather(fetch(1), fetch(2))
+
+def poll(attempt):
+    """ A dummy polling keyword that succeeds on the 50th attempt """
+    rlog("polling")
+    return attempt >= 50
+
 @pytest.fixture
 def fixtureWithSetup():
     rlog("setup")
@@ -128,3 +150,43 @@ def test_assert_in_test_body_and_teardown(fixtureWithTeardownError):
     """ A test that fails in fixture setup and teardown phase """
     rlog("here")
     check_sum(1,2,4)
+
+@pytest.mark.passing
+def test_polling_loop():
+    """ A test that calls the same keyword repeatedly (see --robot-fold-keywords) """
+    attempt = 0
+    while not poll(attempt):
+        attempt += 1
+
+@pytest.mark.passing
+def test_caught_keyword_error():
+    """ A passing test that catches the error of a failing keyword """
+    with pytest.raises(ValueError):
+        raises_value_error()
+
+@pytest.mark.passing
+def test_gather_coroutines():
+    """ A test that runs coroutines concurrently in asyncio tasks """
+    assert asyncio.run(fetch_all()) == [1, 2]
+
+@pytest.mark.passing
+def test_thread_pool():
+    """ A test that calls keywords in a thread pool (see --autotrace-threads) """
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert list(pool.map(calc_sum, [1, 2], [3, 4])) == [4, 6]
+
+@pytest.mark.passing
+def test_convert_truncated_journal(tmp_path):
+    """ A journal of a killed run, which ends inside a keyword that logged a
+        message, is converted with the open test and keyword ended """
+    journal_path = str(tmp_path / "journal.jsonl")
+    journal = JournalWriter(journal_path)
+    journal.open()
+    journal.start_suite("suite")
+    journal.start_test("test")
+    journal.start_keyword("keyword")
+    journal.log_message("message")
+    journal.close()
+    output = tmp_path / "output.xml"
+    convert_journal(journal_path, str(output))
+    assert output.read_text().count("Execution was interrupted") == 2